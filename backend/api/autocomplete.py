@@ -0,0 +1,99 @@
+"""Автодополнение названий продуктов.
+
+На PostgreSQL поиск идёт по индексам на lower(name): btree с
+text_pattern_ops для префиксов и GIN pg_trgm для подстрок (миграция
+recipes 0008). На остальных СУБД используется индекс в памяти процесса,
+построенный по кэшу справочника продуктов.
+Совпадения по префиксу всегда идут раньше совпадений по подстроке.
+"""
+from bisect import bisect_left
+from threading import Lock
+
+from django.db import connection
+from django.db.models.functions import Lower
+
+from recipes.cache import ingredient_cache
+from recipes.models import Ingredient
+
+
+class PrefixIndex:
+    """Отсортированный по названию индекс продуктов.
+
+    Поиск по префиксу - бинарный поиск по отсортированным ключам
+    (компактная замена префиксного дерева), по подстроке - просмотр ключей.
+    """
+
+    def __init__(self, ingredients):
+        self.items = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.keys = [item[0] for item in self.items]
+
+    @staticmethod
+    def ingredient(item):
+        _, pk, name, measurement_unit = item
+        return Ingredient(
+            pk=pk, name=name, measurement_unit=measurement_unit
+        )
+
+    def search(self, query, limit):
+        query = query.lower()
+        found = []
+        index = bisect_left(self.keys, query)
+        while (
+            len(found) < limit and index < len(self.keys)
+            and self.keys[index].startswith(query)
+        ):
+            found.append(self.items[index])
+            index += 1
+        if len(found) < limit:
+            for key, item in zip(self.keys, self.items):
+                if query in key and not key.startswith(query):
+                    found.append(item)
+                    if len(found) == limit:
+                        break
+        return [self.ingredient(item) for item in found]
+
+
+_index = None
+_index_source = None
+_index_lock = Lock()
+
+
+def get_prefix_index():
+    """Индекс продуктов, перестраиваемый при обновлении справочника."""
+    global _index, _index_source
+    ingredients, _ = ingredient_cache.load()
+    with _index_lock:
+        if _index_source is not ingredients:
+            _index = PrefixIndex(
+                (ingredient.pk, ingredient.name, ingredient.measurement_unit)
+                for ingredient in ingredients.values()
+            )
+            _index_source = ingredients
+        return _index
+
+
+def search_database(query, limit):
+    query = query.lower()
+    ingredients = Ingredient.objects.annotate(
+        lower_name=Lower('name')
+    ).order_by('lower_name', 'measurement_unit')
+    found = list(ingredients.filter(lower_name__startswith=query)[:limit])
+    if len(found) < limit:
+        found += ingredients.filter(
+            lower_name__contains=query
+        ).exclude(
+            lower_name__startswith=query
+        )[:limit - len(found)]
+    return found
+
+
+def autocomplete(query, limit):
+    """Продукты, название которых содержит query, префиксные - первыми."""
+    if not query:
+        return []
+    if connection.vendor == 'postgresql':
+        return search_database(query, limit)
+    return get_prefix_index().search(query, limit)
@@ -1 +1,34 @@
 PAGE_SIZE = 6
+SHOPPING_LIST_CHUNK_LINES = 100
+SHOPPING_LIST_ITERATOR_CHUNK = 2000
+SHOPPING_LIST_PDF_FONT_SIZE = 12
+SHOPPING_LIST_PDF_MARGIN = 20
+AUTOCOMPLETE_LIMIT = 20
+AUTOCOMPLETE_MAX_LIMIT = 100
+RECIPE_VERSION_FIELDS = (
+    'pk', 'pub_date', 'updated_at', 'favorites_count',
+    'author_is_subscribed', 'author__username', 'author__email',
+    'author__first_name', 'author__last_name', 'author__avatar',
+    'author__avatar_variants',
+)
+BULK_MAX_IDS = 1000
+IMAGE_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+BASE64_CHUNK_SIZE = 64 * 1024
+RECIPE_ORDERINGS = {
+    'new': ('-pub_date', '-id'),
+    'popular': ('-popularity_score', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+FEED_TIMELINE_MIN_FOLLOWING = 100
+FEED_TIMELINE_SIZE = 800
+FEED_TIMELINE_TIMEOUT = 60
+SEARCH_CONFIG = 'russian'
+SEARCH_SNIPPET_WORDS = 24
+SEARCH_HIGHLIGHT_START = '\x02'
+SEARCH_HIGHLIGHT_STOP = '\x03'
+USER_RECIPES_TIMEOUT = 30
+RECIPE_DETAIL_TIMEOUT = 60 * 60
+RESPONSE_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_LOCK_TIMEOUT = 10
+RESPONSE_CACHE_LOCK_WAIT = 0.05
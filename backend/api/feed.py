@@ -0,0 +1,38 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Лента собирается при чтении одним запросом к рецептам с условием
+author IN (подписки пользователя) и читается по индексу
+(author, pub_date). Для пользователей с большим числом подписок id
+последних FEED_TIMELINE_SIZE рецептов ленты кэшируются на
+FEED_TIMELINE_TIMEOUT секунд, и лента ограничивается ими.
+Подписка и отписка сбрасывают кэш ленты пользователя.
+"""
+from django.core.cache import cache
+
+from recipes.models import Follow, Recipe
+
+from .constants import (
+    FEED_TIMELINE_MIN_FOLLOWING, FEED_TIMELINE_SIZE, FEED_TIMELINE_TIMEOUT
+)
+
+
+def timeline_key(user_id):
+    return f'recipe-feed:{user_id}'
+
+
+def get_feed(recipes, user):
+    """Оставляет в recipes только рецепты из ленты пользователя."""
+    following = Follow.objects.filter(user=user).values('author')
+    if user.following_count < FEED_TIMELINE_MIN_FOLLOWING:
+        return recipes.filter(author__in=following)
+    pks = cache.get(timeline_key(user.pk))
+    if pks is None:
+        pks = list(Recipe.objects.filter(
+            author__in=following
+        ).values_list('pk', flat=True)[:FEED_TIMELINE_SIZE])
+        cache.set(timeline_key(user.pk), pks, FEED_TIMELINE_TIMEOUT)
+    return recipes.filter(pk__in=pks)
+
+
+def invalidate_timeline(user):
+    cache.delete(timeline_key(user.pk))
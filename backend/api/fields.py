@@ -0,0 +1,129 @@
+import base64
+import binascii
+import posixpath
+import weakref
+from io import BytesIO
+from uuid import uuid4
+
+import filetype
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile, TemporaryUploadedFile, UploadedFile
+)
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+from .constants import BASE64_CHUNK_SIZE, IMAGE_MAX_PIXELS, IMAGE_MAX_SIZE
+
+BASE64_HEADER = ';base64,'
+
+
+def close_quietly(file):
+    """Закрывает временный файл, который хранилище могло уже перенести."""
+    try:
+        file.close()
+    except FileNotFoundError:
+        pass
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Картинка в base64 или обычным файлом из multipart-запроса.
+
+    Base64 декодируется частями прямо в загружаемый файл (во временный
+    файл на диске для больших загрузок), без полной копии в памяти.
+    Слишком большие файлы и картинки с огромным числом пикселей
+    (декомпрессионные бомбы) отклоняются до полного декодирования.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер картинки больше {max_size} МБ.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+        'not_image': 'Загрузите картинку в base64 или файлом.',
+    }
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif isinstance(data, UploadedFile):
+            data.name = '{}{}'.format(
+                uuid4(), posixpath.splitext(data.name)[1]
+            )
+        else:
+            self.fail('not_image')
+        if data.size > IMAGE_MAX_SIZE:
+            self.fail_too_large()
+        data.seek(0)
+        self.check_pixels(data)
+        data.seek(0)
+        return serializers.ImageField.to_internal_value(self, data)
+
+    def fail_too_large(self):
+        self.fail('too_large', max_size=IMAGE_MAX_SIZE // 1024 // 1024)
+
+    def check_pixels(self, file):
+        try:
+            width, height = Image.open(file).size
+        except Image.DecompressionBombError:
+            width, height = IMAGE_MAX_PIXELS, 2
+        except OSError:
+            return
+        if width * height > IMAGE_MAX_PIXELS:
+            self.fail('too_many_pixels', max_pixels=IMAGE_MAX_PIXELS)
+
+    def decode(self, data):
+        start = data.find(BASE64_HEADER)
+        start = 0 if start == -1 else start + len(BASE64_HEADER)
+        encoded_size = len(data) - start
+        if encoded_size // 4 * 3 > IMAGE_MAX_SIZE:
+            self.fail_too_large()
+        if encoded_size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile('image', None, 0, None)
+            weakref.finalize(file, close_quietly, file.file)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, 'image', None, 0, None
+            )
+        head = None
+        remainder = ''
+        try:
+            for position in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = remainder + ''.join(
+                    data[position:position + BASE64_CHUNK_SIZE].split()
+                )
+                aligned = len(chunk) - len(chunk) % 4
+                remainder = chunk[aligned:]
+                decoded = base64.b64decode(chunk[:aligned])
+                if head is None:
+                    head = decoded
+                    self.check_pixels(BytesIO(head))
+                file.write(decoded)
+            if remainder:
+                file.write(base64.b64decode(
+                    remainder + '=' * (-len(remainder) % 4)
+                ))
+        except (TypeError, binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.size = file.tell()
+        extension = self.guess_extension(head or b'')
+        if extension not in self.ALLOWED_TYPES:
+            file.close()
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        file.name = f'{uuid4()}.{extension}'
+        return file
+
+    @staticmethod
+    def guess_extension(head):
+        extension = filetype.guess_extension(head)
+        if extension is None:
+            try:
+                extension = Image.open(BytesIO(head)).format.lower()
+            except (OSError, AttributeError):
+                pass
+        return extension
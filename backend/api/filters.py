@@ -1,14 +1,9 @@
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Tag, Recipe
+from recipes.models import Tag, Recipe
 
-
-class IngredientsFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+from .constants import RECIPE_ORDERINGS
+from .search import search_recipes
 
 
 class RecipesFilter(FilterSet):
@@ -19,6 +14,11 @@ class RecipesFilter(FilterSet):
         to_field_name='slug',
         queryset=Tag.objects.all()
     )
+    search = filters.CharFilter(method='search_text')
+    ordering = filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in RECIPE_ORDERINGS],
+        method='order'
+    )
 
     class Meta:
         model = Recipe
@@ -35,3 +35,12 @@ class RecipesFilter(FilterSet):
                 shoppingcarts__user=self.request.user
             )
         return recipes
+
+    def search_text(self, recipes, name, value):
+        """Полнотекстовый поиск, самые релевантные рецепты первыми."""
+        return search_recipes(recipes, value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
+
+    def order(self, recipes, name, value):
+        return recipes.order_by(*RECIPE_ORDERINGS[value])
@@ -0,0 +1,120 @@
+import json
+import random
+import time
+from statistics import median, quantiles
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.autocomplete import PrefixIndex, autocomplete
+from api.constants import AUTOCOMPLETE_LIMIT
+from recipes.cache import ingredient_cache
+from recipes.models import Ingredient
+
+FILL_BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет автодополнение продуктов: индекс в памяти на данных '
+        'из файла (с синтетическими строками) и поиск в текущей БД. '
+        'С --fill синтетические строки добавляются и в БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='data/ingredients.json')
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Сколько синтетических продуктов добавить к файлу.'
+        )
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument(
+            '--database', action='store_true',
+            help='Также замерить поиск через текущую БД.'
+        )
+        parser.add_argument(
+            '--fill', action='store_true',
+            help='Добавить синтетические продукты в БД (только для '
+                 'тестовой БД).'
+        )
+        parser.add_argument(
+            '--confirm', action='store_true',
+            help='Разрешить --fill для БД, в которой уже есть продукты.'
+        )
+
+    def measure(self, title, search, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query, AUTOCOMPLETE_LIMIT)
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            '{}: запросов {}, медиана {:.3f} мс, p95 {:.3f} мс'.format(
+                title, len(timings), median(timings),
+                quantiles(timings, n=20)[-1]
+            )
+        )
+
+    def fill(self, synthetic):
+        start = time.perf_counter()
+        for offset in range(0, len(synthetic), FILL_BATCH_SIZE):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for _, name, measurement_unit in
+                    synthetic[offset:offset + FILL_BATCH_SIZE]
+                ),
+                ignore_conflicts=True
+            )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE {}'.format(
+                    connection.ops.quote_name(Ingredient._meta.db_table)
+                ))
+        ingredient_cache.invalidate()
+        self.stdout.write('Добавлено в БД {} продуктов: {:.1f} с'.format(
+            len(synthetic), time.perf_counter() - start
+        ))
+
+    def handle(self, *args, **options):
+        if (
+            options['fill'] and not options['confirm']
+            and Ingredient.objects.exists()
+        ):
+            raise CommandError(
+                'В БД уже есть продукты: --fill добавит в неё синтетические '
+                'данные. Запустите команду на тестовой БД или добавьте '
+                '--confirm.'
+            )
+        with open(options['path'], encoding='utf-8') as f:
+            names = [
+                (pk, item['name'], item['measurement_unit'])
+                for pk, item in enumerate(json.load(f), 1)
+            ]
+        random.seed(0)
+        words = [name for _, name, _ in names]
+        synthetic = [
+            (
+                len(names) + pk,
+                '{} {} {}'.format(
+                    random.choice(words), random.choice(words), pk
+                ),
+                'г'
+            )
+            for pk in range(1, options['synthetic'] + 1)
+        ]
+        names += synthetic
+        if options['fill']:
+            self.fill(synthetic)
+        start = time.perf_counter()
+        index = PrefixIndex(names)
+        self.stdout.write('Построение индекса из {} строк: {:.2f} с'.format(
+            len(names), time.perf_counter() - start
+        ))
+        queries = [
+            word[:random.randint(1, min(len(word), 6))]
+            for word in random.choices(words, k=options['queries'])
+        ]
+        self.measure('Индекс в памяти', index.search, queries)
+        if options['database']:
+            self.measure('Поиск в БД', autocomplete, queries)
@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import timedelta
+from statistics import median, quantiles
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from api.constants import PAGE_SIZE, RECIPE_ORDERINGS
+from recipes.models import Favorite, Recipe, User
+
+FILL_BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет ленту популярных рецептов: чтение по индексу оценок '
+        'против GROUP BY по избранному. С --fill сначала заполняет БД '
+        'синтетическими рецептами и избранным.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fill', action='store_true',
+            help='Создать синтетические данные (только для тестовой БД).'
+        )
+        parser.add_argument(
+            '--confirm', action='store_true',
+            help='Разрешить --fill для БД, в которой уже есть рецепты.'
+        )
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--favorites', type=int, default=10_000_000)
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Сколько пользователей добавляют рецепты в избранное.'
+        )
+        parser.add_argument('--queries', type=int, default=50)
+
+    def fill(self, recipes_total, favorites_total, users_total):
+        random.seed(0)
+        start = time.perf_counter()
+        users = User.objects.bulk_create(
+            User(
+                username=f'benchmark{number}',
+                email=f'benchmark{number}@example.com',
+                password='!'
+            )
+            for number in range(users_total)
+        )
+        all_recipe_ids = []
+        for offset in range(0, recipes_total, FILL_BATCH_SIZE):
+            batch = Recipe.objects.bulk_create(
+                Recipe(
+                    author=users[number % users_total],
+                    name=f'Рецепт {number}',
+                    text='Текст',
+                    cooking_time=random.randint(1, 120)
+                )
+                for number in range(
+                    offset, min(offset + FILL_BATCH_SIZE, recipes_total)
+                )
+            )
+            all_recipe_ids.extend(recipe.pk for recipe in batch)
+        self.stdout.write('Рецептов: {}, {:.1f} с'.format(
+            recipes_total, time.perf_counter() - start
+        ))
+        start = time.perf_counter()
+        per_user = favorites_total // users_total
+        now = timezone.now()
+        for user in users:
+            # Популярность рецептов распределена неравномерно.
+            recipe_ids = set()
+            while len(recipe_ids) < min(per_user, recipes_total):
+                recipe_ids.add(all_recipe_ids[
+                    int(recipes_total * random.random() ** 3)
+                ])
+            recipe_ids = list(recipe_ids)
+            for offset in range(0, len(recipe_ids), FILL_BATCH_SIZE):
+                batch = Favorite.objects.bulk_create(
+                    Favorite(user=user, recipe_id=pk)
+                    for pk in recipe_ids[offset:offset + FILL_BATCH_SIZE]
+                )
+                Favorite.objects.filter(
+                    pk__in=[favorite.pk for favorite in batch]
+                ).update(created_at=now - timedelta(
+                    days=random.uniform(0, 365)
+                ))
+        self.stdout.write(
+            'Избранного: {}, {:.1f} с. Счётчики favorites_count '
+            'обновит reconcile_counters.'.format(
+                per_user * users_total, time.perf_counter() - start
+            )
+        )
+
+    def measure(self, title, query, queries):
+        timings = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            list(query())
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            '{}: запросов {}, медиана {:.3f} мс, p95 {:.3f} мс'.format(
+                title, len(timings), median(timings),
+                quantiles(timings, n=20)[-1]
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options['fill']:
+            if Recipe.objects.exists() and not options['confirm']:
+                raise CommandError(
+                    'В БД уже есть рецепты: --fill добавит в неё '
+                    'синтетические данные. Запустите команду на тестовой '
+                    'БД или добавьте --confirm.'
+                )
+            self.fill(
+                options['recipes'], options['favorites'], options['users']
+            )
+        start = time.perf_counter()
+        call_command('update_recipe_scores', stdout=self.stdout)
+        self.stdout.write('Пересчёт оценок: {:.1f} с'.format(
+            time.perf_counter() - start
+        ))
+        popular = Recipe.objects.order_by(*RECIPE_ORDERINGS['popular'])
+        threshold = popular.values_list(
+            'popularity_score', flat=True
+        )[PAGE_SIZE * 10:PAGE_SIZE * 10 + 1].first() or 0
+        self.measure(
+            'Первая страница по индексу',
+            lambda: popular.values_list('pk', flat=True)[:PAGE_SIZE],
+            options['queries']
+        )
+        self.measure(
+            'Следующая страница по курсору',
+            lambda: popular.filter(
+                popularity_score__lt=threshold
+            ).values_list('pk', flat=True)[:PAGE_SIZE],
+            options['queries']
+        )
+        self.measure(
+            'GROUP BY по избранному',
+            lambda: Recipe.objects.annotate(
+                favorites_total=Count('favorites')
+            ).order_by('-favorites_total', '-id').values_list(
+                'pk', flat=True
+            )[:PAGE_SIZE],
+            options['queries']
+        )
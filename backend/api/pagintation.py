@@ -1,4 +1,5 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 from .constants import PAGE_SIZE
 
@@ -8,3 +9,74 @@ class Pagination(PageNumberPagination):
 
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+
+    def get_page_version(self):
+        """Данные страницы, не вошедшие в результаты, для ETag."""
+        return self.page.paginator.count
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация без OFFSET и COUNT(*).
+
+    Количество записей считается, только если передан ?with_count=1.
+    """
+
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    count_query_param = 'with_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = (
+            queryset.count()
+            if request.query_params.get(self.count_query_param)
+            in ('1', 'true', 'True')
+            else None
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        """Порядок, заданный фильтром (?ordering=popular), иначе ordering."""
+        return tuple(queryset.query.order_by) or self.ordering
+
+    def get_page_version(self):
+        return self.count, self.has_next, self.has_previous
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('username',)
+
+
+class KeysetPaginationMixin:
+    """Включает курсорную пагинацию параметром ?pagination=cursor."""
+
+    pagination_query_param = 'pagination'
+    keyset_pagination_class = None
+
+    def use_keyset_pagination(self):
+        return self.request.query_params.get(
+            self.pagination_query_param
+        ) == 'cursor'
+
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, '_paginator')
+            and self.keyset_pagination_class is not None
+            and self.use_keyset_pagination()
+        ):
+            self._paginator = self.keyset_pagination_class()
+        return super().paginator
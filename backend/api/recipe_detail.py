@@ -0,0 +1,41 @@
+"""Общая для всех пользователей часть представления рецепта.
+
+Представление рецепта без флагов текущего пользователя хранится в кэше
+Django (Redis при заданном REDIS_URL) по ключу из версии рецепта: полей
+рецепта и автора из RECIPE_VERSION_FIELDS и версий справочников тегов и
+продуктов. Изменение рецепта, его автора, тегов или продуктов даёт новый
+ключ, а старая запись истекает через RECIPE_DETAIL_TIMEOUT секунд.
+Флаги is_subscribed, is_favorited и is_in_shopping_cart накладываются
+на общую часть при каждом ответе.
+"""
+from django.core.cache import cache
+
+from recipes.cache import ingredient_cache, tag_cache
+
+from .constants import RECIPE_DETAIL_TIMEOUT
+from .utils import make_etag
+
+USER_FIELDS = ('author_is_subscribed',)
+
+
+def cache_key(version, base_url):
+    return 'recipe-detail:{}:{}'.format(version['pk'], make_etag(
+        base_url,
+        {
+            field: value for field, value in version.items()
+            if field not in USER_FIELDS
+        },
+        tag_cache.current_version(),
+        ingredient_cache.current_version()
+    ).strip('"'))
+
+
+def get_recipe_detail(version, base_url, serialize):
+    """Возвращает общую часть представления, при промахе вызывает
+    serialize() и сохраняет результат."""
+    key = cache_key(version, base_url)
+    data = cache.get(key)
+    if data is None:
+        data = dict(serialize())
+        cache.set(key, data, RECIPE_DETAIL_TIMEOUT)
+    return data
@@ -0,0 +1,145 @@
+"""Кэш готовых ответов списков для анонимных пользователей.
+
+Ответ списка для анонимного пользователя зависит только от адреса и
+параметров запроса, поэтому хранится в кэше Django целиком. Ключ
+строится из нормализованных параметров (порядок параметров и значений
+не важен) и версий данных. Версия рецептов меняется при сохранении и
+удалении рецептов, их продуктов, тегов и пользователей; теги и продукты
+используют версии справочников. Счётчики, рейтинги и уменьшенные копии
+картинок обновляются без сигналов и попадают в ответ не позже чем через
+RESPONSE_CACHE_TIMEOUT секунд.
+
+При промахе ответ строит только один процесс, взявший блокировку;
+остальные ждут, пока ответ появится в кэше.
+"""
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import Recipe, RecipeIngredients, User
+
+from .constants import (
+    RESPONSE_CACHE_LOCK_TIMEOUT, RESPONSE_CACHE_LOCK_WAIT,
+    RESPONSE_CACHE_TIMEOUT
+)
+from .utils import make_etag
+
+AUTHOR_FIELDS = frozenset((
+    'username', 'email', 'first_name', 'last_name',
+    'avatar', 'avatar_variants'
+))
+
+
+def version_key(namespace):
+    return f'response-cache:{namespace}:version'
+
+
+def current_version(namespace):
+    return cache.get_or_set(version_key(namespace), uuid4().hex, None)
+
+
+def invalidate(namespace):
+    """Меняет версию после фиксации транзакции: иначе параллельный промах
+    сохранил бы прежние данные под новой версией."""
+    transaction.on_commit(
+        lambda: cache.set(version_key(namespace), uuid4().hex, None)
+    )
+
+
+def normalize_query(query_params):
+    """Параметры запроса без пустых значений, в постоянном порядке."""
+    return tuple(sorted(
+        (name, tuple(sorted(value for value in values if value)))
+        for name, values in query_params.lists()
+        if any(values)
+    ))
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширует ответы cached_response для анонимных пользователей."""
+
+    response_cache_namespace = None
+
+    def get_response_cache_versions(self):
+        return (current_version(self.response_cache_namespace),)
+
+    def get_response_cache_key(self, request):
+        return 'response-cache:{}:{}'.format(
+            self.response_cache_namespace,
+            make_etag(
+                request.build_absolute_uri(request.path),
+                normalize_query(request.query_params),
+                self.get_response_cache_versions()
+            ).strip('"')
+        )
+
+    def cached_hit(self, request, cached):
+        data, etag = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(data)
+        response['ETag'] = etag
+        response['X-Response-Cache'] = 'hit'
+        return response
+
+    def cached_response(self, request, get_response):
+        if request.user.is_authenticated:
+            return get_response()
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            return self.cached_hit(request, cached)
+        lock_key = f'{key}:lock'
+        if not cache.add(lock_key, 1, RESPONSE_CACHE_LOCK_TIMEOUT):
+            deadline = time.monotonic() + RESPONSE_CACHE_LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(RESPONSE_CACHE_LOCK_WAIT)
+                cached = cache.get(key)
+                if cached is not None:
+                    return self.cached_hit(request, cached)
+                if cache.get(lock_key) is None:
+                    break
+            return get_response()
+        try:
+            response = get_response()
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(
+                    key, (response.data, response.get('ETag')),
+                    RESPONSE_CACHE_TIMEOUT
+                )
+                response['X-Response-Cache'] = 'miss'
+        finally:
+            cache.delete(lock_key)
+        return response
+
+
+def invalidate_recipes(sender, **kwargs):
+    invalidate('recipes')
+
+
+def invalidate_author(sender, created=False, update_fields=None, **kwargs):
+    """Меняет версию, только если сохранены поля автора из ответа.
+
+    Вход пользователя сохраняет last_login, регистрация создаёт
+    пользователя без рецептов - ни то ни другое не меняет списки.
+    """
+    if created or (
+        update_fields is not None
+        and AUTHOR_FIELDS.isdisjoint(update_fields)
+    ):
+        return
+    invalidate('recipes')
+
+
+for model in (Recipe, RecipeIngredients):
+    post_save.connect(invalidate_recipes, sender=model)
+    post_delete.connect(invalidate_recipes, sender=model)
+post_save.connect(invalidate_author, sender=User)
+post_delete.connect(invalidate_recipes, sender=User)
+m2m_changed.connect(invalidate_recipes, sender=Recipe.tags.through)
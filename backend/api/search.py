@@ -0,0 +1,89 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+На PostgreSQL поиск идёт по вычисляемой колонке search_vector с
+GIN-индексом (русская конфигурация, название весит больше описания),
+на SQLite - по таблице FTS5 recipes_recipe_fts (recipes.fts).
+Рецепты аннотируются релевантностью search_rank (больше - лучше) и
+фрагментом описания search_snippet, в котором совпадения обрамлены
+SEARCH_HIGHLIGHT_START и SEARCH_HIGHLIGHT_STOP.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, TextField, Value
+from django.db.models.expressions import RawSQL
+
+from recipes.fts import FTS_TABLE
+from recipes.models import Recipe
+
+from .constants import (
+    SEARCH_CONFIG, SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_STOP,
+    SEARCH_SNIPPET_WORDS
+)
+
+
+def search_postgresql(recipes, query):
+    from django.contrib.postgres.search import (
+        SearchHeadline, SearchQuery, SearchRank, SearchVectorField
+    )
+
+    search_query = SearchQuery(
+        query, config=SEARCH_CONFIG, search_type='websearch'
+    )
+    return recipes.annotate(
+        search_vector=RawSQL(
+            '{}.search_vector'.format(
+                connection.ops.quote_name(Recipe._meta.db_table)
+            ),
+            (),
+            output_field=SearchVectorField()
+        )
+    ).filter(search_vector=search_query).annotate(
+        search_rank=SearchRank('search_vector', search_query),
+        search_snippet=SearchHeadline(
+            'text', search_query,
+            config=SEARCH_CONFIG,
+            start_sel=SEARCH_HIGHLIGHT_START,
+            stop_sel=SEARCH_HIGHLIGHT_STOP,
+            max_words=SEARCH_SNIPPET_WORDS,
+            min_words=SEARCH_SNIPPET_WORDS // 2,
+        )
+    )
+
+
+def search_sqlite(recipes, query):
+    # Каждое слово запроса - отдельная фраза FTS5 с поиском по префиксу.
+    words = re.findall(r'\w+', query)
+    if not words:
+        return recipes.annotate(
+            search_rank=Value(0.0), search_snippet=Value('')
+        ).none()
+    match = ' '.join(f'"{word}"*' for word in words)
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    matching = f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    return recipes.filter(
+        pk__in=RawSQL(f'SELECT rowid {matching}', (match,))
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) {matching} '
+            f'AND rowid = {table}.id',
+            (match,),
+            output_field=FloatField()
+        ),
+        search_snippet=RawSQL(
+            f'SELECT snippet({FTS_TABLE}, 1, %s, %s, %s, %s) {matching} '
+            f'AND rowid = {table}.id',
+            (
+                SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_STOP, '…',
+                SEARCH_SNIPPET_WORDS, match
+            ),
+            output_field=TextField()
+        ),
+    )
+
+
+def search_recipes(recipes, query):
+    """Рецепты, подходящие под query, с релевантностью и фрагментом."""
+    if connection.vendor == 'postgresql':
+        return search_postgresql(recipes, query)
+    return search_sqlite(recipes, query)
@@ -1,39 +1,81 @@
+import hashlib
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.html import escape
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from recipes.cache import tag_cache
 from recipes.constants import MIN_COOKING_TIME, MIN_AMOUNT
+from recipes.images import schedule_variants
+
+from .constants import (
+    BULK_MAX_IDS, SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_STOP
+)
+from .fields import StreamingBase64ImageField
+from .user_recipes import UserRecipes
 from recipes.models import (
     Favorite, Follow, Ingredient,
     Recipe, RecipeIngredients,
-    Tag, ShoppingCart, User
+    Tag, ShoppingCart, ShoppingCartIngredient, User
 )
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки."""
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        storage = default_storage
+        return {
+            variant: {
+                extension: (
+                    request.build_absolute_uri(storage.url(name))
+                    if request else storage.url(name)
+                )
+                for extension, name in files.items()
+            }
+            for variant, files in variants.items()
+        }
+
+
 class AvatarSerializer(serializers.ModelSerializer):
     """Сериалайзер аватарки."""
 
-    avatar = Base64ImageField(allow_null=True)
+    avatar = StreamingBase64ImageField(allow_null=True)
 
     class Meta:
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        instance.avatar_variants = {}
+        instance = super().update(instance, validated_data)
+        if instance.avatar:
+            schedule_variants(instance)
+        return instance
+
 
 class FoodgramUserSerializer(UserSerializer):
     """Сериалайзер пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
 
     class Meta:
         model = User
         fields = (
             *UserSerializer.Meta.fields,
             'is_subscribed',
-            'avatar'
+            'avatar',
+            'avatar_variants'
         )
 
     def get_is_subscribed(self, user):
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
         return 'request' in self.context and (
             self.context['request'].user.is_authenticated
         ) and (
@@ -80,13 +122,16 @@ class GetRecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientForRecipeSerializer(
         many=True, source='recipe_ingredients'
     )
-    tags = TagSerializer(many=True)
+    tags = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date', )
+        exclude = (
+            'pub_date', 'updated_at', 'popularity_score', 'trending_score'
+        )
         read_only_fields = (
             'id',
             'tags',
@@ -94,18 +139,43 @@ class GetRecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
+    def to_representation(self, recipe):
+        representation = super().to_representation(recipe)
+        if getattr(recipe, 'search_snippet', None) is not None:
+            representation['search_snippet'] = escape(
+                recipe.search_snippet
+            ).replace(
+                SEARCH_HIGHLIGHT_START, '<mark>'
+            ).replace(SEARCH_HIGHLIGHT_STOP, '</mark>')
+        return representation
+
+    def get_tags(self, recipe):
+        # Справочник тегов проверяется один раз на ответ, а не на рецепт.
+        if 'tags' not in self.context:
+            self.context['tags'], _ = tag_cache.load()
+        tags = self.context['tags']
+        return TagSerializer(
+            [tags[tag.pk] for tag in recipe.tags.all() if tag.pk in tags],
+            many=True
+        ).data
+
     def check_recipe(self, recipe, recipe_model):
-        return 'request' in self.context and (
-            self.context['request'].user.is_authenticated
-        ) and recipe_model.objects.filter(
-            user=self.context['request'].user, recipe=recipe
-        ).exists()
+        """Проверяет рецепт по общему для ответа множеству user_recipes."""
+        if 'request' not in self.context:
+            return False
+        if 'user_recipes' not in self.context:
+            self.context['user_recipes'] = UserRecipes(
+                self.context['request'].user
+            )
+        return self.context['user_recipes'].contains(recipe_model, recipe.pk)
 
     def get_is_favorited(self, recipe):
         return self.check_recipe(recipe, Favorite)
@@ -117,7 +187,7 @@ class GetRecipeSerializer(serializers.ModelSerializer):
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериалайзер ингредиента для рецепта."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(min_value=MIN_AMOUNT)
 
     class Meta:
@@ -131,10 +201,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(
         many=True, source='recipe_ingredients'
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all()
-    )
-    image = Base64ImageField()
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
+    image = StreamingBase64ImageField()
     cooking_time = serializers.IntegerField(
         min_value=MIN_COOKING_TIME
     )
@@ -150,6 +218,41 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    @staticmethod
+    def check_ids(ids, found, name):
+        """Проверяет id на повторы и наличие среди найденных объектов."""
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1
+        )
+        if duplicates:
+            raise serializers.ValidationError(
+                '{} с id {} указаны несколько раз.'.format(
+                    name, ', '.join(map(str, duplicates))
+                )
+            )
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                '{} с id {} не найдены.'.format(
+                    name, ', '.join(map(str, missing))
+                )
+            )
+
+    def validate_tags(self, ids):
+        tags, _ = tag_cache.load()
+        self.check_ids(ids, tags, 'Теги')
+        return [tags[pk] for pk in ids]
+
+    def validate_ingredients(self, recipe_ingredients):
+        ids = [
+            recipe_ingredient['id'] for recipe_ingredient in recipe_ingredients
+        ]
+        ingredients = Ingredient.objects.in_bulk(ids)
+        self.check_ids(ids, ingredients, 'Продукты')
+        for recipe_ingredient in recipe_ingredients:
+            recipe_ingredient['id'] = ingredients[recipe_ingredient['id']]
+        return recipe_ingredients
+
     @staticmethod
     def set_ingredients(recipe, recipe_ingredients):
         RecipeIngredients.objects.bulk_create(
@@ -167,34 +270,136 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         self.set_ingredients(recipe, recipe_ingredients)
         recipe.save()
+        schedule_variants(recipe)
         return recipe
 
+    @staticmethod
+    def update_ingredients(recipe, recipe_ingredients):
+        """Применяет к продуктам рецепта только изменившиеся строки."""
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredients.objects.filter(
+                recipe=recipe
+            ).select_for_update()
+        }
+        new_amounts = {
+            recipe_ingredient['id'].id: recipe_ingredient['amount']
+            for recipe_ingredient in recipe_ingredients
+        }
+        # Удалённые строки вычитает из списков покупок сигнал post_delete.
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+            if ingredient_id in new_amounts
+        }
+        removed = [
+            recipe_ingredient.pk
+            for ingredient_id, recipe_ingredient in current.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            RecipeIngredients.objects.filter(pk__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        )
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe, old_amounts, new_amounts
+        )
+
+    @staticmethod
+    def is_same_image(image, upload):
+        """Совпадает ли загруженная картинка с уже сохранённой."""
+        if not image:
+            return False
+        try:
+            if image.storage.size(image.name) != upload.size:
+                return False
+            digests = []
+            for file in (image, upload):
+                digest = hashlib.sha256()
+                file.open('rb')
+                for chunk in file.chunks():
+                    digest.update(chunk)
+                digests.append(digest.digest())
+        except OSError:
+            return False
+        finally:
+            image.close()
+            upload.seek(0)
+        return digests[0] == digests[1]
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        recipe_ingredients = validated_data.pop('recipe_ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.set_ingredients(instance, recipe_ingredients)
-        return super().update(instance, validated_data)
+        recipe_ingredients = validated_data.pop('recipe_ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if recipe_ingredients is not None:
+            self.update_ingredients(instance, recipe_ingredients)
+        if 'image' in validated_data:
+            if self.is_same_image(instance.image, validated_data['image']):
+                del validated_data['image']
+            else:
+                validated_data['image_variants'] = {}
+        changed = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        instance.save(update_fields=(*changed, 'updated_at'))
+        if 'image' in changed:
+            schedule_variants(instance)
+        return instance
 
     def to_representation(self, instance):
         return GetRecipeSerializer(instance, context=self.context).data
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Сериалайзер списка id для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериалайзер для сокращённого представления."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class FollowingSerializer(FoodgramUserSerializer):
-    """Сериалайзер подписок."""
+    """Сериалайзер подписок.
+
+    Ожидает авторов, подготовленных FoodgramUserViewSet.get_following_queryset:
+    с предзагруженными рецептами limited_recipes.
+    """
 
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count')
+    recipes = ShortRecipeSerializer(
+        many=True, read_only=True, source='limited_recipes'
+    )
 
     class Meta:
         model = User
@@ -203,17 +408,3 @@ class FollowingSerializer(FoodgramUserSerializer):
             'recipes',
             'recipes_count'
         )
-
-    def get_recipes(self, user):
-        recipies_limit = 10**10
-        try:
-            recipies_limit = int(self.context['request'].GET.get(
-                'recipes_limit', default=10**10
-            ))
-        except (TypeError, ValueError):
-            pass
-
-        return ShortRecipeSerializer(
-            user.recipes.all()[:recipies_limit],
-            many=True
-        ).data
@@ -0,0 +1,83 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favorite, Follow, Ingredient, Recipe,
+    RecipeIngredients, ShoppingCart, Tag, User
+)
+
+RECIPES_COUNT = 12
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass'
+            )
+            for i in range(2)
+        ]
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Имя', last_name='Фамилия', password='pass'
+        )
+        Follow.objects.create(user=cls.user, author=authors[0])
+        for i in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=authors[i % 2], name=f'Рецепт {i}', text='Текст',
+                image='recipes_images/recipe.png', cooking_time=10
+            )
+            recipe.tags.set(tags[i % 3:i % 3 + 2])
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+                for ingredient in ingredients[i % 3:i % 3 + 3]
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def count_queries(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def check_list(self, client):
+        small, small_queries = self.count_queries(
+            client, '/api/recipes/?limit=2'
+        )
+        large, large_queries = self.count_queries(
+            client, '/api/recipes/?limit=50'
+        )
+        self.assertEqual(len(small.data['results']), 2)
+        self.assertEqual(len(large.data['results']), RECIPES_COUNT)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_authenticated_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.check_list(client)
+
+    def test_anonymous_list(self):
+        self.check_list(APIClient())
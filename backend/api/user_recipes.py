@@ -0,0 +1,57 @@
+"""id рецептов текущего пользователя в избранном и списке покупок.
+
+Флаги is_favorited и is_in_shopping_cart для всех рецептов ответа
+проверяются по множествам id, загруженным одним запросом на модель за
+запрос. Множества кэшируются на USER_RECIPES_TIMEOUT секунд; изменения
+избранного и списка покупок через API сбрасывают кэш пользователя.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import USER_RECIPES_TIMEOUT
+
+
+def cache_key(user_id, model):
+    return f'user-recipes:{model._meta.model_name}:{user_id}'
+
+
+class UserRecipes:
+    """Множества id рецептов пользователя, загружаемые при первом обращении."""
+
+    def __init__(self, user):
+        self.user = user
+        self.ids = {}
+        self.invalidated = set()
+
+    def get_ids(self, model):
+        if not self.user.is_authenticated:
+            return frozenset()
+        if model not in self.ids:
+            shared = model not in self.invalidated
+            ids = cache.get(cache_key(self.user.pk, model)) if shared else None
+            if ids is None:
+                ids = frozenset(model.objects.filter(
+                    user=self.user
+                ).values_list('recipe_id', flat=True))
+                if shared:
+                    cache.set(
+                        cache_key(self.user.pk, model), ids,
+                        USER_RECIPES_TIMEOUT
+                    )
+            self.ids[model] = ids
+        return self.ids[model]
+
+    def contains(self, model, recipe_id):
+        return recipe_id in self.get_ids(model)
+
+    def invalidate(self, model):
+        """Сбрасывает множество после изменения списка model.
+
+        Общий кэш очищается после фиксации транзакции: иначе параллельный
+        запрос успел бы положить туда прежнее множество. До конца запроса
+        множество читается из БД в обход кэша.
+        """
+        self.ids.pop(model, None)
+        self.invalidated.add(model)
+        key = cache_key(self.user.pk, model)
+        transaction.on_commit(lambda: cache.delete(key))
@@ -1,23 +1,116 @@
+import csv
+import hashlib
+import io
+from itertools import islice
+
+from django.conf import settings
 from django.utils.timezone import localtime
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .constants import (
+    SHOPPING_LIST_CHUNK_LINES, SHOPPING_LIST_PDF_FONT_SIZE,
+    SHOPPING_LIST_PDF_MARGIN
+)
 
 SHOPPING_LIST = '{index}. {ingredient_name}, {units} - {sum}'
+SHOPPING_LIST_CSV_HEADER = ('№', 'Продукт', 'Единица измерения', 'Количество')
+SHOPPING_LIST_PDF_FONT = 'DejaVuSans'
+SHOPPING_LIST_PDF_FONT_PATH = (
+    settings.BASE_DIR / 'data' / 'fonts' / 'DejaVuSans.ttf'
+)
+
+
+def make_etag(*parts):
+    """Строгий ETag из версий данных, от которых зависит ответ."""
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def chunked(lines, size=SHOPPING_LIST_CHUNK_LINES):
+    """Склеивает строки (str или bytes) в блоки для потоковой отдачи."""
+    lines = iter(lines)
+    while chunk := list(islice(lines, size)):
+        yield chunk[0][:0].join(chunk)
 
 
 def get_shopping_list(ingredients, recipes):
-    """Функция для получения списка покупок."""
-    return '\n'.join([
-        'Список покупок на {}'.format(localtime().date().strftime('%d/%m/%y')),
-        '',
-        'Продукты:',
-        *(SHOPPING_LIST.format(
+    """Генератор текстового списка покупок."""
+    yield 'Список покупок на {}\n\nПродукты:\n'.format(
+        localtime().date().strftime('%d/%m/%y')
+    )
+    for index, (name, units, total) in enumerate(ingredients, 1):
+        yield SHOPPING_LIST.format(
             index=index,
-            ingredient_name=ingredient[
-                'ingredient__name'
-            ].capitalize(),
-            units=ingredient['ingredient__measurement_unit'],
-            sum=ingredient['sum']
-        ) for index, ingredient in enumerate(ingredients, 1)),
-        '',
-        'Для рецептов:',
-        *recipes.values_list('name', flat=True)
-    ])
+            ingredient_name=name.capitalize(),
+            units=units,
+            sum=total
+        ) + '\n'
+    yield '\nДля рецептов:\n'
+    for name in recipes:
+        yield name + '\n'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_list_csv(ingredients, recipes):
+    """Генератор списка покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_CSV_HEADER)
+    for index, (name, units, total) in enumerate(ingredients, 1):
+        yield writer.writerow((index, name.capitalize(), units, total))
+    yield writer.writerow(())
+    yield writer.writerow(('Для рецептов:',))
+    for name in recipes:
+        yield writer.writerow((name,))
+
+
+def get_shopping_list_pdf(ingredients, recipes):
+    """Список покупок в формате PDF.
+
+    PDF собирается целиком в памяти и отдаётся одним блоком. Шрифт
+    DejaVu Sans встраивается в файл ради кириллицы.
+    """
+    if SHOPPING_LIST_PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(SHOPPING_LIST_PDF_FONT, SHOPPING_LIST_PDF_FONT_PATH)
+        )
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = SHOPPING_LIST_PDF_MARGIN * mm
+    leading = SHOPPING_LIST_PDF_FONT_SIZE * 1.4
+    text = None
+    for line in get_shopping_list(ingredients, recipes):
+        for part in simpleSplit(
+            line.rstrip('\n'), SHOPPING_LIST_PDF_FONT,
+            SHOPPING_LIST_PDF_FONT_SIZE, width - 2 * margin
+        ) or ['']:
+            if text is None or text.getY() - leading < margin:
+                if text is not None:
+                    pdf.drawText(text)
+                    pdf.showPage()
+                text = pdf.beginText(margin, height - margin)
+                text.setFont(
+                    SHOPPING_LIST_PDF_FONT, SHOPPING_LIST_PDF_FONT_SIZE,
+                    leading
+                )
+            text.textLine(part)
+    pdf.drawText(text)
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (get_shopping_list, 'text/plain; charset=utf-8'),
+    'csv': (get_shopping_list_csv, 'text/csv; charset=utf-8'),
+    'pdf': (get_shopping_list_pdf, 'application/pdf'),
+}
@@ -1,5 +1,11 @@
-from django.db.models import Sum
-from django.http import FileResponse, Http404
+from django.db import transaction
+from django.db.models import (
+    Exists, F, OuterRef, Prefetch, Value, Window
+)
+from django.db.models.functions import RowNumber
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -10,55 +16,329 @@ from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.validators import ValidationError
 
+from recipes.cache import ingredient_cache, tag_cache
+from recipes.counters import COUNTERS, change_counters
 from recipes.models import (
     Favorite, Follow, Ingredient,
     Recipe, RecipeIngredients,
-    Tag, ShoppingCart, User
+    Tag, ShoppingCart, ShoppingCartIngredient, User
 )
+from recipes.short_links import encode, recipe_exists
 
-from .filters import IngredientsFilter, RecipesFilter
+from .filters import RecipesFilter
 from .serializers import (
-    AvatarSerializer, FollowingSerializer,
+    AvatarSerializer, BulkIdsSerializer, FollowingSerializer,
     FoodgramUserSerializer, GetRecipeSerializer,
     IngredientSerializer, RecipeSerializer,
     ShortRecipeSerializer, TagSerializer
 )
-from .pagintation import Pagination
-from .utils import get_shopping_list
+from .autocomplete import autocomplete
+from .feed import get_feed, invalidate_timeline
+from .recipe_detail import get_recipe_detail
+from .response_cache import AnonymousResponseCacheMixin
+from .user_recipes import UserRecipes
+from .constants import (
+    AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT, RECIPE_VERSION_FIELDS,
+    SHOPPING_LIST_ITERATOR_CHUNK
+)
+from .pagintation import (
+    KeysetPaginationMixin, Pagination,
+    RecipeKeysetPagination, UserKeysetPagination
+)
+from .utils import SHOPPING_LIST_FORMATS, chunked, make_etag
+
+
+def annotate_is_subscribed(users, user):
+    """Аннотирует пользователей флагом подписки текущего пользователя."""
+    if not user.is_authenticated:
+        return users.annotate(is_subscribed=Value(False))
+    return users.annotate(is_subscribed=Exists(
+        Follow.objects.filter(user=user, author=OuterRef('pk'))
+    ))
+
+
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Пакетные изменения списков одного пользователя выполняются по очереди:
+    иначе повтор запроса прочитал бы те же списки и учёл бы добавленные
+    строки в счётчиках и списке покупок дважды.
+    """
+    User.objects.select_for_update().only('pk').get(pk=user.pk)
+
+
+def delete_rows(queryset):
+    """Удаляет строки одним DELETE, без сигналов post_delete на строку.
+
+    Возвращает удалённые строки: счётчики и список покупок вызывающий код
+    обновляет сам, одним запросом на все строки.
+    """
+    rows = list(queryset)
+    queryset.model.objects.filter(
+        pk__in=[row.pk for row in rows]
+    )._raw_delete(queryset.db)
+    return rows
+
+
+class ReferenceViewSetMixin(AnonymousResponseCacheMixin):
+    """Отдаёт справочник из кэша в памяти процесса."""
+
+    reference_cache = None
+
+    @property
+    def response_cache_namespace(self):
+        return self.reference_cache.model._meta.model_name
 
+    @cached_property
+    def reference(self):
+        """Справочник, прочитанный один раз за запрос: объекты, признак
+        попадания в кэш и версия прочитанной копии."""
+        return self.reference_cache.load_version()
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_response_cache_versions(self):
+        return (self.reference[2],)
+
+    def filter_reference(self, objects):
+        return objects
+
+    def reference_response(self, data, hit):
+        return Response(data, headers={
+            'X-Reference-Cache': 'hit' if hit else 'miss'
+        })
+
+    def conditional_response(self, request, get_response):
+        """Отвечает 304, если содержимое справочника не изменилось."""
+        etag = make_etag(self.reference[2])
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = get_response()
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        def get_response():
+            objects, hit, _ = self.reference
+            return self.reference_response(self.get_serializer(
+                self.filter_reference(objects.values()), many=True
+            ).data, hit)
+        return self.cached_response(
+            request, lambda: self.conditional_response(request, get_response)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        def get_response():
+            objects, hit, _ = self.reference
+            try:
+                instance = objects[int(kwargs[self.lookup_field])]
+            except (KeyError, ValueError):
+                raise Http404
+            return self.reference_response(
+                self.get_serializer(instance).data, hit
+            )
+        return self.conditional_response(request, get_response)
+
+
+class TagViewSet(ReferenceViewSetMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет тегов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    reference_cache = tag_cache
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceViewSetMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет ингредиентов."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientsFilter
+    reference_cache = ingredient_cache
 
+    def filter_reference(self, ingredients):
+        name = self.request.query_params.get('name', '').lower()
+        return [
+            ingredient for ingredient in ingredients
+            if ingredient.name.lower().startswith(name)
+        ]
 
-class RecipesViewSet(viewsets.ModelViewSet):
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='autocomplete',
+    )
+    def autocomplete(self, request):
+        try:
+            limit = min(
+                max(int(request.query_params['limit']), 1),
+                AUTOCOMPLETE_MAX_LIMIT
+            )
+        except (KeyError, TypeError, ValueError):
+            limit = AUTOCOMPLETE_LIMIT
+        return Response(IngredientSerializer(
+            autocomplete(request.query_params.get('name', ''), limit),
+            many=True
+        ).data)
+
+
+class RecipesViewSet(
+    AnonymousResponseCacheMixin, KeysetPaginationMixin, viewsets.ModelViewSet
+):
     """Вьюсет рецетов."""
 
     queryset = Recipe.objects.all()
     serializer_class = GetRecipeSerializer
     pagination_class = Pagination
+    keyset_pagination_class = RecipeKeysetPagination
     filter_backends = (DjangoFilterBackend,)
+    response_cache_namespace = 'recipes'
     filterset_class = RecipesFilter
 
+    def get_queryset(self):
+        user = self.request.user
+        recipes = super().get_queryset()
+        if self.action == 'feed':
+            recipes = get_feed(recipes, user)
+        return recipes.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=annotate_is_subscribed(User.objects.all(), user)
+            ),
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    @cached_property
+    def user_recipes(self):
+        return UserRecipes(self.request.user)
+
+    def get_serializer_context(self):
+        return {
+            **super().get_serializer_context(),
+            'user_recipes': self.user_recipes
+        }
+
+    def get_flags(self, versions):
+        """Флаги избранного и списка покупок рецептов - для ETag."""
+        return [
+            (
+                self.user_recipes.contains(Favorite, version['pk']),
+                self.user_recipes.contains(ShoppingCart, version['pk'])
+            )
+            for version in versions
+        ]
+
+    def get_versions(self, recipes):
+        """Данные, от которых зависит представление рецептов."""
+        if self.request.user.is_authenticated:
+            author_is_subscribed = Exists(Follow.objects.filter(
+                user=self.request.user, author=OuterRef('author')
+            ))
+        else:
+            author_is_subscribed = Value(False)
+        # Курсорной пагинации нужны значения полей сортировки.
+        ordering = (
+            field.lstrip('-') for field in recipes.query.order_by
+            if field.lstrip('-') not in ('id', *RECIPE_VERSION_FIELDS)
+        )
+        return recipes.prefetch_related(None).annotate(
+            author_is_subscribed=author_is_subscribed
+        ).values(*RECIPE_VERSION_FIELDS, *ordering)
+
+    def make_etag(self, *parts):
+        return make_etag(
+            *parts,
+            tag_cache.current_version(),
+            ingredient_cache.current_version()
+        )
+
+    def get_response_cache_versions(self):
+        return (
+            *super().get_response_cache_versions(),
+            tag_cache.current_version(),
+            ingredient_cache.current_version()
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.get_list_response)
+
+    def get_list_response(self):
+        recipes = self.filter_queryset(self.get_queryset())
+        versions = self.paginate_queryset(self.get_versions(recipes))
+        etag = self.make_etag(
+            versions, self.get_flags(versions),
+            self.paginator.get_page_version()
+        )
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            recipes = recipes.in_bulk(version['pk'] for version in versions)
+            response = self.get_paginated_response(self.get_serializer(
+                [recipes[version['pk']] for version in versions], many=True
+            ).data)
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            versions = list(self.get_versions(
+                self.get_queryset().filter(pk=kwargs['pk'])
+            ))
+        except ValueError:
+            raise Http404
+        if not versions:
+            raise Http404
+        etag = self.make_etag(versions, self.get_flags(versions))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_detail(versions[0]))
+        response['ETag'] = etag
+        return response
+
+    def get_detail(self, version):
+        """Представление рецепта из общего кэша с флагами пользователя."""
+        data = get_recipe_detail(
+            version,
+            self.request.build_absolute_uri('/'),
+            lambda: self.get_serializer(self.get_object()).data
+        )
+        return {
+            **data,
+            'author': {
+                **data['author'],
+                'is_subscribed': version['author_is_subscribed']
+            },
+            'is_favorited': self.user_recipes.contains(
+                Favorite, version['pk']
+            ),
+            'is_in_shopping_cart': self.user_recipes.contains(
+                ShoppingCart, version['pk']
+            ),
+        }
+
+    def use_keyset_pagination(self):
+        return self.action == 'feed' or super().use_keyset_pagination()
+
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return GetRecipeSerializer
         return RecipeSerializer
 
+    def reload_instance(self, serializer):
+        """Перечитывает рецепт с предзагруженными связями для ответа."""
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        self.reload_instance(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.reload_instance(serializer)
 
     @action(
         methods=['post', 'delete'],
@@ -69,17 +349,42 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk=None):
         return self.highlight_recipe(request, Favorite, pk=pk)
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/bulk',
+    )
+    def favorite_bulk(self, request):
+        return self.highlight_recipes(request, Favorite)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='feed',
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сначала."""
+        return self.list(request)
+
     @action(
         methods=['get'],
         detail=True,
         url_path='get-link',
     )
     def get_link(self, request, pk=None):
-        if not Recipe.objects.filter(pk=pk).exists():
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404(f'Рецепт с id {pk} не найден.')
+        if not recipe_exists(pk):
             raise Http404(f'Рецепт с id {pk} не найден.')
         return Response({
             'short-link':
-            request.build_absolute_uri(reverse('recipes:short_url', args=[pk]))
+            request.build_absolute_uri(
+                reverse('recipes:short_url', args=[encode(pk)])
+            )
         }, status=status.HTTP_200_OK)
 
     @action(
@@ -89,20 +394,33 @@ class RecipesViewSet(viewsets.ModelViewSet):
         url_path='download_shopping_cart',
     )
     def download_shopping_cart(self, request):
-        return FileResponse(
-            get_shopping_list(
-                RecipeIngredients.objects.filter(
-                    recipe__shoppingcarts__user=self.request.user
-                ).values(
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise ValidationError({'type': 'Доступные форматы: {}.'.format(
+                ', '.join(SHOPPING_LIST_FORMATS)
+            )})
+        get_shopping_list, content_type = SHOPPING_LIST_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            chunked(get_shopping_list(
+                ShoppingCartIngredient.objects.filter(
+                    user=self.request.user
+                ).values_list(
                     'ingredient__name',
-                    'ingredient__measurement_unit'
-                ).annotate(sum=Sum('amount')).order_by('ingredient__name'),
+                    'ingredient__measurement_unit',
+                    'amount',
+                ).order_by(
+                    'ingredient__name', 'ingredient__measurement_unit'
+                ).iterator(chunk_size=SHOPPING_LIST_ITERATOR_CHUNK),
                 Recipe.objects.filter(
                     shoppingcarts__user=self.request.user
-                )
-            ),
-            content_type='text/plain'
+                ).values_list('name', flat=True).iterator()
+            )),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"'
         )
+        return response
 
     @action(
         methods=['post', 'delete'],
@@ -112,6 +430,71 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk=None):
         return self.highlight_recipe(request, ShoppingCart, pk=pk)
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        return self.highlight_recipes(request, ShoppingCart)
+
+    @transaction.atomic
+    def highlight_recipes(self, request, model):
+        """Добавляет или удаляет рецепты из списка одним запросом.
+
+        Возвращает статус для каждого переданного id.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = self.request.user
+        lock_user(user)
+        found = set(
+            Recipe.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        highlighted = set(model.objects.filter(
+            user=user, recipe__in=ids
+        ).values_list('recipe_id', flat=True))
+        if request.method == 'POST':
+            changed = [pk for pk in found if pk not in highlighted]
+            created = model.objects.bulk_create(
+                (model(user=user, recipe_id=pk) for pk in changed),
+                ignore_conflicts=True
+            )
+            if model in COUNTERS:
+                change_counters(model, created)
+            if model is ShoppingCart:
+                ShoppingCartIngredient.objects.add_recipes(user, changed)
+            statuses = ('added', 'already_added')
+            self.user_recipes.invalidate(model)
+        else:
+            changed = list(highlighted)
+            deleted = delete_rows(
+                model.objects.filter(user=user, recipe__in=changed)
+            )
+            if model in COUNTERS:
+                change_counters(model, deleted, sign=-1)
+            if model is ShoppingCart:
+                ShoppingCartIngredient.objects.add_recipes(
+                    user, changed, sign=-1
+                )
+            statuses = ('removed', 'not_added')
+            self.user_recipes.invalidate(model)
+        changed = set(changed)
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else statuses[0] if pk in changed
+                    else statuses[1]
+                )
+            }
+            for pk in ids
+        ]}, status=status.HTTP_200_OK)
+
+    @transaction.atomic
     def highlight_recipe(self, request, model, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
         user = self.request.user
@@ -123,22 +506,55 @@ class RecipesViewSet(viewsets.ModelViewSet):
                         recipe.name, model._meta.verbose_name.lower()
                     )
                 )
+            self.user_recipes.invalidate(model)
             return Response(
-                ShortRecipeSerializer(recipe).data,
+                ShortRecipeSerializer(
+                    recipe, context=self.get_serializer_context()
+                ).data,
                 status=status.HTTP_201_CREATED
             )
         get_object_or_404(model, recipe=recipe, user=user).delete()
+        self.user_recipes.invalidate(model)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class FoodgramUserViewSet(UserViewSet):
+class FoodgramUserViewSet(KeysetPaginationMixin, UserViewSet):
     """Вьюсет для работы с пользователями."""
 
     queryset = User.objects.all()
     serializer_class = FoodgramUserSerializer
     pagination_class = Pagination
+    keyset_pagination_class = UserKeysetPagination
     permission_classes = (AllowAny,)
 
+    def get_recipes_limit(self):
+        try:
+            return int(self.request.query_params['recipes_limit'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def get_following_queryset(self, authors):
+        """Авторы с первыми recipes_limit рецептами.
+
+        Рецепты всех авторов страницы загружаются одним оконным запросом.
+        """
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id', 'pub_date'
+        )
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )).filter(row_number__lte=recipes_limit)
+        return annotate_is_subscribed(
+            authors, self.request.user
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
     def get_permissions(self):
         if (self.action == 'me'):
             return (IsAuthenticated(),)
@@ -173,9 +589,9 @@ class FoodgramUserViewSet(UserViewSet):
     def get_subscriptions(self, request):
         return self.get_paginated_response(
             FollowingSerializer(
-                self.paginate_queryset(
+                self.paginate_queryset(self.get_following_queryset(
                     User.objects.filter(authors__user=self.request.user)
-                ),
+                )),
                 many=True,
                 context={'request': request}
             ).data
@@ -192,6 +608,7 @@ class FoodgramUserViewSet(UserViewSet):
         user = self.request.user
         if request.method == 'DELETE':
             get_object_or_404(Follow, user=user, author=author).delete()
+            invalidate_timeline(user)
             return Response(status=status.HTTP_204_NO_CONTENT)
         if author == user:
             raise ValidationError(
@@ -207,10 +624,67 @@ class FoodgramUserViewSet(UserViewSet):
                     'errors':
                     f'Вы уже подписаны на пользователя {author.username}.'
                 })
+        invalidate_timeline(user)
         return Response(
             FollowingSerializer(
-                author,
+                self.get_following_queryset(User.objects.all()).get(
+                    pk=author.pk
+                ),
                 context={'request': request}
             ).data,
             status=status.HTTP_201_CREATED
         )
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe/bulk',
+    )
+    @transaction.atomic
+    def subscribe_bulk(self, request):
+        """Подписывается на авторов или отписывается от них одним запросом.
+
+        Возвращает статус для каждого переданного id.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = self.request.user
+        lock_user(user)
+        found = set(
+            User.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        following = set(Follow.objects.filter(
+            user=user, author__in=ids
+        ).values_list('author_id', flat=True))
+        if request.method == 'POST':
+            changed = [
+                pk for pk in found if pk not in following and pk != user.pk
+            ]
+            change_counters(Follow, Follow.objects.bulk_create(
+                (Follow(user=user, author_id=pk) for pk in changed),
+                ignore_conflicts=True
+            ))
+            statuses = ('subscribed', 'already_subscribed')
+        else:
+            changed = list(following)
+            change_counters(Follow, delete_rows(
+                Follow.objects.filter(user=user, author__in=changed)
+            ), sign=-1)
+            statuses = ('unsubscribed', 'not_subscribed')
+        if changed:
+            invalidate_timeline(user)
+        changed = set(changed)
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else 'self' if pk == user.pk
+                    else statuses[0] if pk in changed
+                    else statuses[1]
+                )
+            }
+            for pk in ids
+        ]}, status=status.HTTP_200_OK)
@@ -1,9 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
-from django.db.models.aggregates import Count
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 
+from .constants import ADMIN_ESTIMATED_COUNT_MIN
 from .models import (
     Favorite, Follow, Ingredient,
     Recipe, RecipeIngredients, Tag, User
@@ -13,31 +18,83 @@ from .models import (
 admin.site.unregister(Group)
 
 
-class HasRecipesMixin():
-    @admin.display(description='Рецептов')
+class EstimatedCountPaginator(Paginator):
+    """Для большой нефильтрованной таблицы PostgreSQL берёт число строк
+    из статистики планировщика вместо COUNT(*)."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ADMIN_ESTIMATED_COUNT_MIN:
+                return int(row[0])
+        return super().count
+
+
+class EstimatedCountMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class HasRecipesMixin:
+    """Количество рецептов подзапросом по таблице связи recipes_through.
+
+    Подзапрос в SELECT считается только для строк текущей страницы.
+    """
+
+    recipes_through = None
+    recipes_through_field = None
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_total=Coalesce(
+                Subquery(
+                    self.recipes_through.objects.filter(
+                        **{self.recipes_through_field: OuterRef('pk')}
+                    ).values(self.recipes_through_field).annotate(
+                        total=Count('pk')
+                    ).values('total')
+                ),
+                0
+            )
+        )
+
+    @admin.display(description='Рецептов', ordering='recipes_total')
     def recipes_count(self, instance):
-        return instance.recipes.count()
+        return instance.recipes_total
 
 
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin, HasRecipesMixin):
+class TagAdmin(HasRecipesMixin, admin.ModelAdmin):
+    recipes_through = Recipe.tags.through
+    recipes_through_field = 'tag'
     list_display = ('name', 'slug', 'recipes_count')
     search_fields = ('name', 'slug')
     search_help_text = 'Поиск по названию и слагу'
 
 
 @admin.register(RecipeIngredients)
-class RecipeIngredientsAdmin(admin.ModelAdmin):
-    pass
+class RecipeIngredientsAdmin(EstimatedCountMixin, admin.ModelAdmin):
+    list_select_related = ('ingredient',)
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
 @admin.register(Favorite)
-class FavouriteAdmin(admin.ModelAdmin):
-    pass
+class FavouriteAdmin(EstimatedCountMixin, admin.ModelAdmin):
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('recipe', 'user')
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin, HasRecipesMixin):
+class IngredientAdmin(HasRecipesMixin, admin.ModelAdmin):
+    recipes_through = RecipeIngredients
+    recipes_through_field = 'ingredient'
     list_display = ('name', 'measurement_unit', 'recipes_count')
     search_fields = ('name', 'measurement_unit')
     search_help_text = 'Поиск по названию и ед. измерения'
@@ -47,13 +104,48 @@ class IngredientAdmin(admin.ModelAdmin, HasRecipesMixin):
 class IngredientsInLine(admin.TabularInline):
     model = RecipeIngredients
     extra = 1
+    autocomplete_fields = ('ingredient',)
+
+
+class AuthorFilter(admin.SimpleListFilter):
+    """Фильтр по нику автора: поле ввода вместо списка всех авторов."""
+
+    title = 'автор'
+    parameter_name = 'author'
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'parameter_name': self.parameter_name,
+            'value': self.value() or '',
+            'placeholder': 'Ник автора',
+            'query_parts': [
+                (name, value)
+                for name, value in changelist.get_filters_params().items()
+                if name != self.parameter_name
+            ],
+            'all_query_string': changelist.get_query_string(
+                remove=[self.parameter_name]
+            ),
+        }
+
+    def queryset(self, request, recipes):
+        if self.value():
+            return recipes.filter(author__username=self.value())
+        return recipes
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(EstimatedCountMixin, admin.ModelAdmin):
     list_display = (
         'id', 'name', 'cooking_time',
-        'author_username', 'recipe_tags', 'in_favorites',
+        'author_username', 'recipe_tags', 'favorites_count',
         'recipe_ingredients', 'recipe_img'
     )
     list_display_links = ('name',)
@@ -61,16 +153,26 @@ class RecipeAdmin(admin.ModelAdmin):
     search_help_text = 'Поиск по названию и автору'
     filter_horizontal = ('tags',)
     inlines = [IngredientsInLine]
-    list_filter = ('tags', 'author__username')
+    list_filter = ('tags', AuthorFilter)
+    autocomplete_fields = ('author',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
 
-    @admin.display(description='Автор')
+    @admin.display(description='Автор', ordering='author__username')
     def author_username(self, recipe):
         return recipe.author.username
 
-    @admin.display(description='Избранное')
-    def in_favorites(self, recipe):
-        return recipe.favorites.count()
-
     @mark_safe
     @admin.display(description='Картинка')
     def recipe_img(self, recipe):
@@ -98,9 +200,10 @@ class RecipeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(EstimatedCountMixin, admin.ModelAdmin):
     list_display = ('user', 'author')
     list_display_links = None
+    list_select_related = ('user', 'author')
 
 
 class UserFilter(admin.SimpleListFilter):
@@ -114,35 +217,34 @@ class UserFilter(admin.SimpleListFilter):
     def queryset(self, request, queryset):
         if self.value() not in self.OPTION_KEYS:
             return queryset
-        filter_expr = {'count__gt': 0} if self.value() == '1' else {'count': 0}
-        return queryset.annotate(
-            count=Count(self.count_expression)
-        ).filter(**filter_expr)
+        if self.value() == '1':
+            return queryset.filter(**{f'{self.counter_field}__gt': 0})
+        return queryset.filter(**{self.counter_field: 0})
 
 
 class HasRecipesFilter(UserFilter):
     title = 'есть рецепты'
     parameter_name = 'has_recipes'
-    count_expression = 'recipes'
+    counter_field = 'recipes_count'
 
 
 class HasFollowersFilter(UserFilter):
     title = 'есть подписчики'
     parameter_name = 'has_followers'
-    count_expression = 'authors'
+    counter_field = 'followers_count'
 
 
 class HasFollowsFilter(UserFilter):
     title = 'есть подписки'
     parameter_name = 'has_follows'
-    count_expression = 'followers'
+    counter_field = 'following_count'
 
 
 @admin.register(User)
-class FoodgramUserAdmin(UserAdmin, HasRecipesMixin):
+class FoodgramUserAdmin(EstimatedCountMixin, UserAdmin):
     search_fields = ('username', 'email')
     search_help_text = 'Поиск по автору и электронной почте'
-    readonly_fields = ('followers', 'users_following', 'recipes')
+    readonly_fields = ('followers_count', 'following_count', 'recipes_count')
     fieldsets = (
         *UserAdmin.fieldsets,
         ('Аватар', {'fields': ('avatar',)}),
@@ -166,15 +268,3 @@ class FoodgramUserAdmin(UserAdmin, HasRecipesMixin):
     def avatar_img(self, user):
         img_src = user.avatar.url if user.avatar else ''
         return f'<img src="{img_src}" style="height:70px;">'
-
-    @admin.display(description='Подписчиков')
-    def followers(self, user):
-        return user.authors.count()
-
-    @admin.display(description='Подписок')
-    def users_following(self, user):
-        return user.followers.count()
-
-    @admin.display(description='Рецептов')
-    def recipes(self, user):
-        return user.recipes.count()
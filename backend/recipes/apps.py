@@ -1,7 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Рецепты'
+
+    def ready(self):
+        from . import (  # noqa: F401
+            cache, counters, shopping_cart, short_links, versions
+        )
+        from .fts import restore_triggers
+
+        post_migrate.connect(restore_triggers, sender=self)
@@ -0,0 +1,110 @@
+"""Кэш справочников (теги и продукты) в памяти процесса.
+
+Каждый процесс держит свою копию справочника, а версия справочника
+хранится в общем кэше Django. Сохранение или удаление записи меняет
+версию, и все процессы перечитывают справочник при следующем обращении.
+Копия также устаревает через REFERENCE_CACHE_TIMEOUT секунд, даже если
+кэш Django не общий для процессов. При каждом перечитывании в журнал
+пишутся счётчики попаданий и промахов процесса.
+
+ETag самого справочника строится из версии и метки перечитывания
+(load_token), поэтому меняется вместе с перечитанными данными. Ответы
+с рецептами учитывают только версию: для неё не нужно читать таблицу.
+"""
+import logging
+import time
+from threading import Lock
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .constants import REFERENCE_CACHE_TIMEOUT
+from .models import Ingredient, Tag
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache:
+    """Справочник модели в памяти процесса со счётчиками попаданий."""
+
+    def __init__(self, model):
+        self.model = model
+        self.version_key = f'reference-cache:{model._meta.label_lower}'
+        self.lock = Lock()
+        self.version = None
+        self.loaded_at = 0
+        self.objects = {}
+        self.load_token = None
+        self.hits = 0
+        self.misses = 0
+
+    def shared_version(self):
+        return cache.get_or_set(self.version_key, uuid4().hex, None)
+
+    def refresh(self):
+        """Перечитывает справочник, если он устарел.
+
+        Возвращает признак того, что копия в памяти была актуальна.
+        """
+        version = self.shared_version()
+        with self.lock:
+            if (
+                self.version == version
+                and time.monotonic() - self.loaded_at < REFERENCE_CACHE_TIMEOUT
+            ):
+                self.hits += 1
+                return True
+            self.misses += 1
+            self.objects = {obj.pk: obj for obj in self.model.objects.all()}
+            self.load_token = uuid4().hex
+            self.version = version
+            self.loaded_at = time.monotonic()
+        logger.info(
+            'Справочник %s перечитан: %s',
+            self.model._meta.model_name, self.stats()
+        )
+        return False
+
+    def current_version(self):
+        """Версия справочника в общем кэше Django, без чтения таблицы."""
+        return self.shared_version()
+
+    def load(self):
+        """Возвращает словарь {pk: объект} и признак попадания в кэш."""
+        hit = self.refresh()
+        return self.objects, hit
+
+    def load_version(self):
+        """Справочник, признак попадания и версия прочитанной копии."""
+        hit = self.refresh()
+        with self.lock:
+            return self.objects, hit, (self.version, self.load_token)
+
+    def all(self):
+        return list(self.load()[0].values())
+
+    def invalidate(self):
+        """Меняет версию после фиксации транзакции: иначе другой процесс
+        успел бы перечитать прежние строки под новой версией."""
+        transaction.on_commit(
+            lambda: cache.set(self.version_key, uuid4().hex, None)
+        )
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+tag_cache = ReferenceCache(Tag)
+ingredient_cache = ReferenceCache(Ingredient)
+REFERENCE_CACHES = {Tag: tag_cache, Ingredient: ingredient_cache}
+
+
+def invalidate_reference_cache(sender, **kwargs):
+    REFERENCE_CACHES[sender].invalidate()
+
+
+for model in REFERENCE_CACHES:
+    post_save.connect(invalidate_reference_cache, sender=model)
+    post_delete.connect(invalidate_reference_cache, sender=model)
@@ -7,3 +7,28 @@ RECIPE_LENGTH = 256
 EMAIL_LENGTH = 254
 USERNAME_LENGTH = 150
 USERNAME_REGEX = r'^[\w.@+-]+\Z'
+SHOPPING_CART_BATCH_SIZE = 1000
+REFERENCE_CACHE_TIMEOUT = 300
+IMAGE_WORKERS = 2
+IMAGE_QUALITY = 80
+RECIPE_IMAGE_VARIANTS = {'card': (480, 480), 'detail': (1200, 1200)}
+AVATAR_IMAGE_VARIANTS = {'avatar': (160, 160)}
+UPLOAD_BATCH_SIZE = 1000
+UPLOAD_JSON_CHUNK_SIZE = 64 * 1024
+RECIPE_ARCHIVE_BATCH_SIZE = 200
+RECIPE_ARCHIVE_RECORDS = 'recipes/{:06d}.ndjson'
+RECIPE_ARCHIVE_IMAGES = 'images/'
+FAVORITE_SCORE_WEIGHT = 1.0
+SHOPPING_CART_SCORE_WEIGHT = 0.5
+POPULARITY_HALF_LIFE_DAYS = 30
+POPULARITY_WINDOW_DAYS = 365
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_WINDOW_DAYS = 7
+SCORE_BATCH_SIZE = 1000
+ADMIN_ESTIMATED_COUNT_MIN = 100_000
+SHORT_LINK_LOCAL_SIZE = 10000
+SHORT_LINK_LOCAL_TIMEOUT = 30
+SHORT_LINK_CACHE_TIMEOUT = 24 * 60 * 60
+SHORT_LINK_MISSING_TIMEOUT = 60
+SHORT_LINK_MAX_AGE = 5 * 60
+SHORT_LINK_MAX_ID = 2 ** 63 - 1
@@ -0,0 +1,63 @@
+"""Счётчики избранного, подписок и рецептов в строках моделей.
+
+Создание и удаление строк Favorite, Follow и Recipe через модель меняет
+счётчики сигналами, массовые вставки (bulk_create) и пакетные удаления
+без сигналов вызывают change_counters явно. Расхождения исправляет
+команда reconcile_counters.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+
+from .models import Favorite, Follow, Recipe, User
+
+# Строки модели-источника: (модель со счётчиком, внешний ключ, поле счётчика).
+COUNTERS = {
+    Favorite: ((Recipe, 'recipe_id', 'favorites_count'),),
+    Follow: (
+        (User, 'author_id', 'followers_count'),
+        (User, 'user_id', 'following_count'),
+    ),
+    Recipe: ((User, 'author_id', 'recipes_count'),),
+}
+
+
+def change_counters(sender, instances, sign=1):
+    """Учитывает созданные (sign=1) или удалённые (sign=-1) строки sender.
+
+    Строки с одинаковым изменением счётчика обновляются одним запросом.
+    """
+    for model, attname, field in COUNTERS[sender]:
+        pks_by_delta = defaultdict(list)
+        for pk, delta in Counter(
+            getattr(instance, attname) for instance in instances
+        ).items():
+            pks_by_delta[sign * delta].append(pk)
+        for delta, pks in pks_by_delta.items():
+            model.objects.filter(pk__in=pks).update(
+                **{field: F(field) + delta}
+            )
+
+
+def live_counts(sender, attname):
+    """Счётчики, вычисленные по строкам sender: {pk: количество}."""
+    return dict(
+        sender.objects.values_list(attname).annotate(
+            total=Count('pk')
+        ).order_by()
+    )
+
+
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counters(sender, [instance])
+
+
+def count_deleted(sender, instance, **kwargs):
+    change_counters(sender, [instance], sign=-1)
+
+
+for model in COUNTERS:
+    post_save.connect(count_created, sender=model)
+    post_delete.connect(count_deleted, sender=model)
@@ -0,0 +1,71 @@
+"""Полнотекстовый поиск рецептов на SQLite.
+
+Таблица FTS5 recipes_recipe_fts с внешним содержимым синхронизируется с
+recipes_recipe триггерами (миграция 0015). SQLite удаляет триггеры
+вместе с таблицей, поэтому любая миграция, пересоздающая recipes_recipe,
+стирает их: после migrate недостающие триггеры создаются заново, а
+индекс перестраивается по текущим рецептам.
+"""
+from django.db import connections
+
+FTS_TABLE = 'recipes_recipe_fts'
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+TRIGGERS = {
+    'recipes_recipe_fts_insert': (
+        'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert '
+        'AFTER INSERT ON recipes_recipe '
+        'BEGIN INSERT INTO recipes_recipe_fts(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'
+    ),
+    'recipes_recipe_fts_delete': (
+        'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete '
+        'AFTER DELETE ON recipes_recipe '
+        'BEGIN INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, '
+        "name, text) VALUES ('delete', old.id, old.name, old.text); END"
+    ),
+    'recipes_recipe_fts_update': (
+        'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update '
+        'AFTER UPDATE OF name, text ON recipes_recipe '
+        'BEGIN INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, '
+        "name, text) VALUES ('delete', old.id, old.name, old.text); "
+        'INSERT INTO recipes_recipe_fts(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'
+    ),
+}
+REBUILD = (
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')"
+)
+
+
+def restore_triggers(sender, using, verbosity=1, **kwargs):
+    """Сигнал post_migrate: вернуть триггеры FTS, удалённые миграциями.
+
+    Пока миграция 0015 не применена (или откачена), таблицы FTS нет и
+    восстанавливать нечего.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT type, name FROM sqlite_master '
+            "WHERE name = %s OR (type = 'trigger' AND name IN ({}))".format(
+                ', '.join(['%s'] * len(TRIGGERS))
+            ),
+            [FTS_TABLE, *TRIGGERS]
+        )
+        existing = {name for _, name in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            return
+        missing = [name for name in TRIGGERS if name not in existing]
+        if not missing:
+            return
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+        cursor.execute(REBUILD)
+    if verbosity:
+        print('Восстановлены триггеры поиска: {}'.format(', '.join(missing)))
@@ -0,0 +1,118 @@
+"""Уменьшенные копии картинок рецептов и аватаров.
+
+Оригинал сохраняется в запросе как раньше, а копии нужных размеров в
+форматах JPEG и WebP строятся в пуле потоков после фиксации транзакции.
+Пути к готовым копиям записываются в JSON-поле модели
+(Recipe.image_variants, User.avatar_variants).
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .constants import (
+    AVATAR_IMAGE_VARIANTS, IMAGE_QUALITY, IMAGE_WORKERS,
+    RECIPE_IMAGE_VARIANTS
+)
+from .models import Recipe, User
+
+IMAGE_FORMATS = (('jpg', 'JPEG'), ('webp', 'WEBP'))
+IMAGE_FIELDS = {
+    Recipe: ('image', 'image_variants', RECIPE_IMAGE_VARIANTS),
+    User: ('avatar', 'avatar_variants', AVATAR_IMAGE_VARIANTS),
+}
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='images'
+)
+
+
+def encode_variants(image, sizes):
+    """Возвращает {вариант: {расширение: байты}} для картинки PIL."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info else 'RGB'
+        )
+    variants = {}
+    for variant, size in sizes.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for extension, image_format in IMAGE_FORMATS:
+            buffer = BytesIO()
+            (
+                thumbnail.convert('RGB') if image_format == 'JPEG'
+                else thumbnail
+            ).save(buffer, image_format, quality=IMAGE_QUALITY)
+            variants[variant][extension] = buffer.getvalue()
+    return variants
+
+
+def encode_content(content, sizes):
+    """Как encode_variants, но для байтов файла - для пула процессов."""
+    with Image.open(BytesIO(content)) as image:
+        return encode_variants(image, sizes)
+
+
+def save_variants(storage, name, encoded):
+    """Сохраняет копии рядом с оригиналом и возвращает их пути."""
+    directory, file_name = posixpath.split(name)
+    stem = posixpath.splitext(file_name)[0]
+    return {
+        variant: {
+            extension: storage.save(
+                posixpath.join(
+                    directory, 'variants', f'{stem}_{variant}.{extension}'
+                ),
+                ContentFile(content)
+            )
+            for extension, content in files.items()
+        }
+        for variant, files in encoded.items()
+    }
+
+
+def build_variants(model, pk):
+    """Строит копии картинки объекта и сохраняет их пути в модели."""
+    field_name, variants_field, sizes = IMAGE_FIELDS[model]
+    try:
+        name = model.objects.filter(pk=pk).values_list(
+            field_name, flat=True
+        ).first()
+        if not name:
+            return
+        storage = model._meta.get_field(field_name).storage
+        with storage.open(name) as file:
+            with Image.open(file) as image:
+                encoded = encode_variants(image, sizes)
+        changes = {variants_field: save_variants(storage, name, encoded)}
+        if model is Recipe:
+            changes['updated_at'] = timezone.now()
+        model.objects.filter(pk=pk, **{field_name: name}).update(**changes)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance):
+    """Ставит построение копий в очередь после фиксации транзакции."""
+    model = type(instance)
+    transaction.on_commit(
+        lambda: executor.submit(
+            build_variants, model, instance.pk
+        ).add_done_callback(log_failure)
+    )
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось построить копии картинки',
+            exc_info=future.exception()
+        )
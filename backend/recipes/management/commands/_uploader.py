@@ -1,24 +1,227 @@
+import csv
+import io
 import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.cache import REFERENCE_CACHES
+from recipes.constants import UPLOAD_BATCH_SIZE, UPLOAD_JSON_CHUNK_SIZE
+
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_json(file, fields):
+    """Построчно разбирает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(UPLOAD_JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидался JSON-массив объектов.')
+    position = 1
+    eof = False
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(UPLOAD_JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def read_ndjson(file, fields):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(file, fields):
+    """Строки CSV с колонками fields; строка заголовка пропускается."""
+    for row in csv.reader(file):
+        row = [value.strip() for value in row]
+        if row and tuple(row) != fields:
+            yield dict(zip(fields, row))
+
+
+READERS = {
+    'json': read_json,
+    'ndjson': read_ndjson,
+    'jsonl': read_ndjson,
+    'csv': read_csv,
+}
 
 
 class UploaderBase(BaseCommand):
+    """Потоковая загрузка справочника из JSON, NDJSON или CSV.
+
+    Наследники задают model, fields - загружаемые поля (и порядок колонок
+    CSV) и unique_fields - поля, по которым запись считается существующей.
+    """
+
+    model = None
+    fields = ()
+    unique_fields = ()
 
     def add_arguments(self, parser):
         parser.add_argument('path')
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию - по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=UPLOAD_BATCH_SIZE,
+            help='Сколько записей вставлять за один запрос.'
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Обновлять существующие записи вместо пропуска.'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY на PostgreSQL.'
+        )
+
+    @property
+    def update_fields(self):
+        return tuple(
+            field for field in self.fields if field not in self.unique_fields
+        )
+
+    def key(self, row):
+        return tuple(row[field] for field in self.unique_fields)
+
+    def batches(self, rows, size):
+        rows = iter(rows)
+        while batch := [
+            {field: row[field] for field in self.fields}
+            for row in islice(rows, size)
+        ]:
+            yield batch
+
+    def find(self, keys):
+        """Записи с ключами из keys: {ключ: объект}."""
+        keys = set(keys)
+        first = self.unique_fields[0]
+        found = (
+            (self.key(vars(instance)), instance)
+            for instance in self.model.objects.filter(**{
+                f'{first}__in': {key[0] for key in keys}
+            })
+        )
+        return {key: instance for key, instance in found if key in keys}
+
+    def load_batch(self, rows, update):
+        """Загружает пачку средствами ORM, возвращает (новых, обновлено)."""
+        rows = {self.key(row): row for row in rows}
+        existing = self.find(rows)
+        changed = []
+        if update and self.update_fields:
+            for key, row in rows.items():
+                instance = existing.get(key)
+                if instance is None or all(
+                    getattr(instance, field) == row[field]
+                    for field in self.update_fields
+                ):
+                    continue
+                for field in self.update_fields:
+                    setattr(instance, field, row[field])
+                changed.append(instance)
+        created = [key for key in rows if key not in existing]
+        with transaction.atomic():
+            self.model.objects.bulk_create(
+                (self.model(**rows[key]) for key in created),
+                ignore_conflicts=True
+            )
+            if changed:
+                self.model.objects.bulk_update(changed, self.update_fields)
+            # ignore_conflicts молча пропускает строки, нарушающие другие
+            # ограничения уникальности: вставленными считаются найденные.
+            inserted = len(self.find(created)) if created else 0
+        return inserted, len(changed)
+
+    def load_batch_copy(self, rows, update):
+        """Загружает пачку через COPY во временную таблицу и INSERT ... ON
+        CONFLICT, возвращает (новых, обновлено)."""
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = ', '.join(quote(field) for field in self.fields)
+        if update and self.update_fields:
+            conflict = 'ON CONFLICT ({}) DO UPDATE SET {} WHERE ({}) IS ' \
+                'DISTINCT FROM ({})'.format(
+                    ', '.join(quote(field) for field in self.unique_fields),
+                    ', '.join(
+                        f'{quote(field)} = EXCLUDED.{quote(field)}'
+                        for field in self.update_fields
+                    ),
+                    ', '.join(
+                        f'{table}.{quote(field)}'
+                        for field in self.update_fields
+                    ),
+                    ', '.join(
+                        f'EXCLUDED.{quote(field)}'
+                        for field in self.update_fields
+                    ),
+                )
+        else:
+            conflict = 'ON CONFLICT DO NOTHING'
+        data = io.StringIO()
+        csv.writer(data).writerows(
+            [row[field] for field in self.fields] for row in rows
+        )
+        data.seek(0)
+        distinct = ', '.join(quote(field) for field in self.unique_fields)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE upload_batch ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY upload_batch ({columns}) FROM STDIN WITH CSV', data
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT DISTINCT ON ({distinct}) '
+                f'{columns} FROM upload_batch {conflict} '
+                f'RETURNING xmax = 0'
+            )
+            inserted = [created for created, in cursor.fetchall()]
+        return inserted.count(True), inserted.count(False)
 
     def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or Path(path).suffix.lstrip('.')
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        load_batch = self.load_batch_copy if use_copy else self.load_batch
+        total = created = updated = 0
+        started = time.perf_counter()
         try:
-            with open(options['path'], 'r', encoding='utf-8') as f:
-                uploaded = self.model.objects.bulk_create(
-                    (self.model(**data) for data in json.load(f)),
-                    ignore_conflicts=True
-                )
-                self.stdout.write(
-                    'Новых записей: {}'.format(len(uploaded)),
-                    ending='\n'
-                )
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for batch in self.batches(
+                    READERS[file_format](f, self.fields),
+                    options['batch_size']
+                ):
+                    batch_created, batch_updated = load_batch(
+                        batch, options['update']
+                    )
+                    total += len(batch)
+                    created += batch_created
+                    updated += batch_updated
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Обработано записей: {total}')
         except Exception as err:
             self.stdout.write(
                 '\n'.join([
@@ -27,3 +230,17 @@ class UploaderBase(BaseCommand):
                 ]),
                 ending='\n'
             )
+        finally:
+            REFERENCE_CACHES[self.model].invalidate()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            '\n'.join([
+                'Новых записей: {}'.format(created),
+                'Обновлено: {}'.format(updated),
+                'Пропущено: {}'.format(total - created - updated),
+                'Скорость: {:.0f} записей/с'.format(
+                    total / elapsed if elapsed else 0
+                ),
+            ]),
+            ending='\n'
+        )
@@ -0,0 +1,127 @@
+import io
+import json
+import posixpath
+import tarfile
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from recipes.constants import (
+    RECIPE_ARCHIVE_BATCH_SIZE, RECIPE_ARCHIVE_IMAGES, RECIPE_ARCHIVE_RECORDS
+)
+from recipes.models import Recipe, RecipeIngredients
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+class Command(BaseCommand):
+    help = 'Выгружает рецепты с продуктами, тегами и картинками в tar.gz.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--batch-size', type=int, default=RECIPE_ARCHIVE_BATCH_SIZE,
+            help='Сколько рецептов выбирать и записывать за раз.'
+        )
+        parser.add_argument(
+            '--no-images', action='store_true',
+            help='Не добавлять картинки в архив.'
+        )
+
+    @staticmethod
+    def batches(size):
+        """Пачки рецептов в виде словарей, по возрастанию id."""
+        last = 0
+        while recipes := list(
+            Recipe.objects.filter(pk__gt=last).order_by('pk').values(
+                'pk', 'name', 'text', 'cooking_time', 'pub_date', 'image',
+                *(f'author__{field}' for field in AUTHOR_FIELDS)
+            )[:size]
+        ):
+            last = recipes[-1]['pk']
+            ingredients = defaultdict(list)
+            for recipe_id, name, unit, amount in (
+                RecipeIngredients.objects.filter(
+                    recipe__in=[recipe['pk'] for recipe in recipes]
+                ).values_list(
+                    'recipe_id', 'ingredient__name',
+                    'ingredient__measurement_unit', 'amount'
+                )
+            ):
+                ingredients[recipe_id].append({
+                    'name': name, 'measurement_unit': unit, 'amount': amount
+                })
+            tags = defaultdict(list)
+            for recipe_id, name, slug in Recipe.tags.through.objects.filter(
+                recipe__in=[recipe['pk'] for recipe in recipes]
+            ).values_list('recipe_id', 'tag__name', 'tag__slug'):
+                tags[recipe_id].append({'name': name, 'slug': slug})
+            yield [
+                {
+                    'name': recipe['name'],
+                    'text': recipe['text'],
+                    'cooking_time': recipe['cooking_time'],
+                    'pub_date': recipe['pub_date'].isoformat(),
+                    'author': {
+                        field: recipe[f'author__{field}']
+                        for field in AUTHOR_FIELDS
+                    },
+                    'tags': tags[recipe['pk']],
+                    'ingredients': ingredients[recipe['pk']],
+                    'image': recipe['image'],
+                }
+                for recipe in recipes
+            ]
+
+    @staticmethod
+    def add_member(archive, name, size, file):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        archive.addfile(info, file)
+
+    def add_images(self, archive, records):
+        """Добавляет картинки пачки и заменяет пути на имена в архиве."""
+        storage = Recipe._meta.get_field('image').storage
+        for number, record in enumerate(records):
+            name, record['image'] = record['image'], None
+            if not name or not storage.exists(name):
+                continue
+            record['image'] = '{}{}/{}'.format(
+                RECIPE_ARCHIVE_IMAGES, number, posixpath.basename(name)
+            )
+            with storage.open(name) as file:
+                self.add_member(
+                    archive, record['image'], storage.size(name), file
+                )
+
+    def handle(self, *args, **options):
+        total = 0
+        started = time.perf_counter()
+        with tarfile.open(options['path'], 'w|gz') as archive:
+            for number, records in enumerate(
+                self.batches(options['batch_size'])
+            ):
+                if options['no_images']:
+                    for record in records:
+                        record['image'] = None
+                else:
+                    self.add_images(archive, records)
+                content = '\n'.join(
+                    json.dumps(record, ensure_ascii=False)
+                    for record in records
+                ).encode()
+                self.add_member(
+                    archive, RECIPE_ARCHIVE_RECORDS.format(number),
+                    len(content), io.BytesIO(content)
+                )
+                total += len(records)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Выгружено рецептов: {total}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            'Выгружено рецептов: {}, {:.0f} рецептов/с'.format(
+                total, total / elapsed if elapsed else 0
+            )
+        )
@@ -0,0 +1,235 @@
+import json
+import logging
+import posixpath
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.cache import REFERENCE_CACHES
+from recipes.constants import RECIPE_ARCHIVE_IMAGES, RECIPE_IMAGE_VARIANTS
+from recipes.counters import change_counters
+from recipes.images import encode_content, save_variants
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredients, Tag, User
+)
+
+logger = logging.getLogger(__name__)
+
+
+def archive_batches(archive):
+    """Пачки (записи рецептов, {имя в архиве: байты картинки}).
+
+    Картинки пачки идут в архиве перед файлом с её записями.
+    """
+    images = {}
+    for member in archive:
+        if not member.isfile():
+            continue
+        content = archive.extractfile(member).read()
+        if member.name.startswith(RECIPE_ARCHIVE_IMAGES):
+            images[member.name] = content
+            continue
+        yield [
+            json.loads(line) for line in content.splitlines() if line.strip()
+        ], images
+        images = {}
+
+
+class Command(BaseCommand):
+    help = 'Загружает рецепты из архива, созданного export_recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов для обработки картинок.'
+        )
+        parser.add_argument(
+            '--no-variants', action='store_true',
+            help='Не строить уменьшенные копии картинок.'
+        )
+        parser.add_argument(
+            '--create-authors', action='store_true',
+            help='Создавать отсутствующих авторов без пароля.'
+        )
+
+    @staticmethod
+    def resolve(model, fields, rows):
+        """Возвращает {ключ: pk}, создавая недостающие записи."""
+        rows = {tuple(row[field] for field in fields): row for row in rows}
+        if not rows:
+            return {}
+
+        def find():
+            return {
+                tuple(values[:-1]): values[-1]
+                for values in model.objects.filter(**{
+                    f'{fields[0]}__in': {key[0] for key in rows}
+                }).values_list(*fields, 'pk')
+            }
+
+        found = find()
+        missing = [
+            model(**row) for key, row in rows.items() if key not in found
+        ]
+        if not missing:
+            return found
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        if model in REFERENCE_CACHES:
+            REFERENCE_CACHES[model].invalidate()
+        return find()
+
+    def get_authors(self, records, create):
+        authors = {
+            record['author']['email']: record['author'] for record in records
+        }
+        if not create:
+            return dict(
+                User.objects.filter(email__in=authors).values_list(
+                    'email', 'pk'
+                )
+            )
+        for author in authors.values():
+            author.setdefault('password', '!')
+        return {
+            email: pk for (email,), pk in
+            self.resolve(User, ('email',), authors.values()).items()
+        }
+
+    def import_batch(self, records, images, pool):
+        """Создаёт рецепты пачки, возвращает число созданных."""
+        futures = {
+            name: pool.submit(encode_content, content, RECIPE_IMAGE_VARIANTS)
+            for name, content in images.items()
+        } if pool else {}
+        try:
+            return self.create_recipes(records, images, futures)
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+
+    def create_recipes(self, records, images, futures):
+        with transaction.atomic():
+            authors = self.get_authors(records, self.create_authors)
+            records = [
+                record for record in records
+                if record['author']['email'] in authors
+            ]
+            # Пропускаются рецепты, уже сохранённые в БД, и повторы в пачке.
+            seen = set(Recipe.objects.filter(
+                author__in=authors.values(),
+                name__in={record['name'] for record in records}
+            ).values_list('author_id', 'name'))
+            unique = []
+            for record in records:
+                key = (authors[record['author']['email']], record['name'])
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(record)
+            records = unique
+            tags = self.resolve(
+                Tag, ('slug',),
+                [tag for record in records for tag in record['tags']]
+            )
+            ingredients = self.resolve(
+                Ingredient, ('name', 'measurement_unit'),
+                [
+                    {
+                        'name': ingredient['name'],
+                        'measurement_unit': ingredient['measurement_unit']
+                    }
+                    for record in records
+                    for ingredient in record['ingredients']
+                ]
+            )
+            recipes = [
+                Recipe(
+                    author_id=authors[record['author']['email']],
+                    name=record['name'],
+                    text=record['text'],
+                    cooking_time=record['cooking_time'],
+                )
+                for record in records
+            ]
+            for recipe, record in zip(recipes, records):
+                if record['image'] in images:
+                    self.set_image(
+                        recipe, record['image'], images[record['image']],
+                        futures.get(record['image'])
+                    )
+            recipes = Recipe.objects.bulk_create(recipes)
+            change_counters(Recipe, recipes)
+            for recipe, record in zip(recipes, records):
+                recipe.pub_date = parse_datetime(record['pub_date'])
+            Recipe.objects.bulk_update(recipes, ('pub_date',))
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe,
+                    ingredient_id=ingredients[
+                        ingredient['name'], ingredient['measurement_unit']
+                    ],
+                    amount=ingredient['amount']
+                )
+                for recipe, record in zip(recipes, records)
+                for ingredient in record['ingredients']
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(
+                    recipe=recipe, tag_id=tags[(tag['slug'],)]
+                )
+                for recipe, record in zip(recipes, records)
+                for tag in record['tags']
+                if (tag['slug'],) in tags
+            )
+        return len(recipes)
+
+    @staticmethod
+    def set_image(recipe, name, content, future):
+        recipe.image.save(
+            posixpath.basename(name), ContentFile(content), save=False
+        )
+        if future is None:
+            return
+        try:
+            recipe.image_variants = save_variants(
+                recipe.image.storage, recipe.image.name, future.result()
+            )
+        except Exception:
+            logger.exception(
+                'Не удалось построить копии картинки %s', recipe.image.name
+            )
+
+    def handle(self, *args, **options):
+        self.create_authors = options['create_authors']
+        total = created = 0
+        started = time.perf_counter()
+        pool = None if options['no_variants'] else ProcessPoolExecutor(
+            max_workers=options['workers']
+        )
+        try:
+            with tarfile.open(options['path'], 'r|*') as archive:
+                for records, images in archive_batches(archive):
+                    created += self.import_batch(records, images, pool)
+                    total += len(records)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Обработано рецептов: {total}')
+        finally:
+            if pool:
+                pool.shutdown()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            '\n'.join([
+                'Новых рецептов: {}'.format(created),
+                'Пропущено: {}'.format(total - created),
+                'Скорость: {:.0f} рецептов/с'.format(
+                    total / elapsed if elapsed else 0
+                ),
+            ]),
+            ending='\n'
+        )
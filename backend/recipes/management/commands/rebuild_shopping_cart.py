@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводную таблицу списков покупок и сверяет её.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу с корзинами, не пересобирая её.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            ShoppingCartIngredient.objects.rebuild()
+            self.stdout.write('Сводная таблица списков покупок пересобрана.')
+        live = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in
+            ShoppingCartIngredient.objects.live_totals().iterator()
+        }
+        stored = dict(
+            ((user_id, ingredient_id), amount)
+            for user_id, ingredient_id, amount in
+            ShoppingCartIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        )
+        mismatched = {
+            key for key in {*live, *stored}
+            if live.get(key) != stored.get(key)
+        }
+        for user_id, ingredient_id in sorted(mismatched):
+            self.stdout.write(
+                'Пользователь {}, продукт {}: в таблице {}, в корзинах {}'
+                .format(
+                    user_id, ingredient_id,
+                    stored.get((user_id, ingredient_id), 0),
+                    live.get((user_id, ingredient_id), 0)
+                )
+            )
+        if mismatched:
+            raise CommandError(f'Расхождений: {len(mismatched)}')
+        self.stdout.write(f'Расхождений нет, записей: {len(stored)}.')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import COUNTERS, live_counts
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики избранного, подписок и рецептов и чинит их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счётчики, не исправляя их.'
+        )
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for sender, counters in COUNTERS.items():
+            for model, attname, field in counters:
+                live = live_counts(sender, attname)
+                for pk, stored in model.objects.values_list(
+                    'pk', field
+                ).iterator():
+                    if live.get(pk, 0) == stored:
+                        continue
+                    mismatched += 1
+                    self.stdout.write(
+                        '{} {}, {}: сохранено {}, на самом деле {}'.format(
+                            model._meta.verbose_name, pk, field,
+                            stored, live.get(pk, 0)
+                        )
+                    )
+                    if not options['check']:
+                        model.objects.filter(pk=pk).update(
+                            **{field: live.get(pk, 0)}
+                        )
+        if mismatched and options['check']:
+            raise CommandError(f'Расхождений: {mismatched}')
+        if mismatched:
+            self.stdout.write(f'Исправлено счётчиков: {mismatched}.')
+        else:
+            self.stdout.write('Расхождений нет.')
@@ -0,0 +1,90 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from recipes.constants import (
+    FAVORITE_SCORE_WEIGHT, POPULARITY_HALF_LIFE_DAYS, POPULARITY_WINDOW_DAYS,
+    SCORE_BATCH_SIZE, SHOPPING_CART_SCORE_WEIGHT, TRENDING_HALF_LIFE_HOURS,
+    TRENDING_WINDOW_DAYS
+)
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+# Поле оценки: (шаг группировки событий, период полураспада, окно).
+SCORES = {
+    'popularity_score': (
+        'day',
+        timedelta(days=POPULARITY_HALF_LIFE_DAYS),
+        timedelta(days=POPULARITY_WINDOW_DAYS),
+    ),
+    'trending_score': (
+        'hour',
+        timedelta(hours=TRENDING_HALF_LIFE_HOURS),
+        timedelta(days=TRENDING_WINDOW_DAYS),
+    ),
+}
+EVENT_WEIGHTS = {
+    Favorite: FAVORITE_SCORE_WEIGHT,
+    ShoppingCart: SHOPPING_CART_SCORE_WEIGHT,
+}
+
+
+def compute_scores(kind, half_life, window, now):
+    """Оценки {recipe_id: оценка} по добавлениям в избранное и корзину.
+
+    Каждое добавление весит EVENT_WEIGHTS и вдвое теряет вес за half_life.
+    События группируются в БД по рецепту и интервалу kind.
+    """
+    scores = defaultdict(float)
+    for model, weight in EVENT_WEIGHTS.items():
+        for recipe_id, moment, total in model.objects.filter(
+            created_at__gte=now - window
+        ).annotate(
+            moment=Trunc('created_at', kind)
+        ).values_list('recipe_id', 'moment').annotate(
+            total=Count('pk')
+        ).order_by().iterator():
+            scores[recipe_id] += weight * total * 0.5 ** (
+                (now - moment) / half_life
+            )
+    return {pk: round(score, 6) for pk, score in scores.items()}
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает оценки популярности рецептов для сортировок '
+        '?ordering=popular и ?ordering=trending.'
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for field, (kind, half_life, window) in SCORES.items():
+            started = time.perf_counter()
+            scores = compute_scores(kind, half_life, window, now)
+            current = dict(
+                Recipe.objects.filter(**{f'{field}__gt': 0}).values_list(
+                    'pk', field
+                ).iterator()
+            )
+            changed = [
+                Recipe(pk=pk, **{field: score})
+                for pk, score in {
+                    **dict.fromkeys(current, 0), **scores
+                }.items()
+                if current.get(pk, 0) != score
+            ]
+            with transaction.atomic():
+                Recipe.objects.bulk_update(
+                    changed, (field,), batch_size=SCORE_BATCH_SIZE
+                )
+            self.stdout.write(
+                '{}: рецептов с оценкой {}, обновлено {}, {:.2f} с'.format(
+                    field, len(scores), len(changed),
+                    time.perf_counter() - started
+                )
+            )
@@ -5,3 +5,5 @@ from ._uploader import UploaderBase
 
 class Command(UploaderBase):
     model = Ingredient
+    fields = ('name', 'measurement_unit')
+    unique_fields = ('name', 'measurement_unit')
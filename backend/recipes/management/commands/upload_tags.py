@@ -5,3 +5,5 @@ from ._uploader import UploaderBase
 
 class Command(UploaderBase):
     model = Tag
+    fields = ('name', 'slug')
+    unique_fields = ('slug',)
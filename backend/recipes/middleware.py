@@ -0,0 +1,21 @@
+import re
+
+from .short_links import short_link_response
+
+SHORT_LINK_PATH = re.compile(r'/s/(?P<code>[0-9A-Za-z]+)/?')
+
+
+class ShortLinkMiddleware:
+    """Отвечает на короткие ссылки до остальных middleware и DRF.
+
+    Сессии, аутентификация и CSRF перенаправлению не нужны.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        match = SHORT_LINK_PATH.fullmatch(request.path_info)
+        if match is None:
+            return self.get_response(request)
+        return short_link_response(request, match['code'])
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.16 on 2026-10-18 03:07
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('User', 'recipes_count', 'Recipe', 'author'),
+    ('User', 'followers_count', 'Follow', 'author'),
+    ('User', 'following_count', 'Follow', 'user'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, source_name, foreign_key in COUNTERS:
+        source = apps.get_model('recipes', source_name)
+        apps.get_model('recipes', model_name).objects.update(**{
+            field: Coalesce(
+                models.Subquery(
+                    source.objects.filter(
+                        **{foreign_key: models.OuterRef('pk')}
+                    ).values(foreign_key).annotate(
+                        total=models.Count('pk')
+                    ).values('total')
+                ),
+                0
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+from recipes import fts
+
+# PostgreSQL: вычисляемая колонка tsvector обновляется при каждой записи
+# строки, поиск идёт по GIN-индексу.
+POSTGRESQL_CREATE = (
+    "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+    ") STORED",
+    'CREATE INDEX recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+POSTGRESQL_DROP = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+# SQLite: таблица FTS5 с внешним содержимым, синхронизируемая триггерами.
+# Миграции, пересоздающие recipes_recipe на SQLite, удаляют триггеры -
+# их возвращает обработчик post_migrate recipes.fts.restore_triggers.
+SQLITE_CREATE = (
+    fts.CREATE_TABLE, *fts.TRIGGERS.values(), fts.REBUILD,
+)
+SQLITE_DROP = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({
+                'postgresql': POSTGRESQL_CREATE, 'sqlite': SQLITE_CREATE
+            }),
+            run_for_vendor({
+                'postgresql': POSTGRESQL_DROP, 'sqlite': SQLITE_DROP
+            }),
+        ),
+    ]
@@ -1,16 +1,37 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Q, Sum
 
 from .constants import (
     EMAIL_LENGTH, INGREDIENT_LENGTH,
     MIN_AMOUNT, MIN_COOKING_TIME, RECIPE_LENGTH,
+    SHOPPING_CART_BATCH_SIZE,
     TAG_LENGTH,
     UNIT_LENGTH, USERNAME_LENGTH, USERNAME_REGEX
 )
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Не перезаписывает счётчики при сохранении изменённого объекта.
+
+    Счётчики меняются только выражениями F() (см. recipes.counters), а
+    сохранение всех полей вернуло бы значения, прочитанные раньше.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Модель пользователя."""
 
     username = models.CharField(
@@ -38,6 +59,28 @@ class User(AbstractUser):
         null=True,
         verbose_name='Аватар'
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии аватара'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписок'
+    )
+
+    counter_fields = ('recipes_count', 'followers_count', 'following_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'username']
@@ -96,13 +139,17 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов."""
 
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Добавлено'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменено'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -110,6 +157,11 @@ class Recipe(models.Model):
     )
     name = models.CharField(max_length=RECIPE_LENGTH, verbose_name='Название')
     image = models.ImageField('Картинка', upload_to='recipes_images')
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии картинки'
+    )
     text = models.TextField(verbose_name='Текстовое описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -117,14 +169,49 @@ class Recipe(models.Model):
         verbose_name='Продукты'
     )
     tags = models.ManyToManyField(Tag, verbose_name='Теги')
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время(мин)',
         validators=[MinValueValidator(MIN_COOKING_TIME)]
     )
 
+    popularity_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность за последние дни'
+    )
+
+    counter_fields = ('favorites_count',)
+
     class Meta:
         default_related_name = 'recipes'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-popularity_score', '-id'],
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_idx'
+            ),
+        ]
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
 
@@ -176,6 +263,10 @@ class BaseUserRecipeModel(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Пользователь'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлено'
+    )
 
     class Meta:
         default_related_name = '%(class)ss'
@@ -185,6 +276,14 @@ class BaseUserRecipeModel(models.Model):
                 name='%(app_label)s_%(class)s_recipe_user',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'], name='%(class)s_user_recipe_idx'
+            ),
+            models.Index(
+                fields=['created_at'], name='%(class)s_created_at_idx'
+            ),
+        ]
         abstract = True
 
     def __str__(self):
@@ -234,8 +333,160 @@ class Follow(models.Model):
                 check=~models.Q(user=models.F('author')),
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Инкрементальное обновление сводного списка покупок."""
+
+    def apply(self, deltas):
+        """Применяет изменения количеств {(user_id, ingredient_id): delta}."""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        users = {user_id for user_id, _ in deltas}
+        ingredients = {ingredient_id for _, ingredient_id in deltas}
+        with transaction.atomic():
+            existing = {
+                (row.user_id, row.ingredient_id): row
+                for row in self.select_for_update().filter(
+                    user__in=users, ingredient__in=ingredients
+                )
+                if (row.user_id, row.ingredient_id) in deltas
+            }
+            changed, removed, created = [], [], []
+            for (user_id, ingredient_id), delta in deltas.items():
+                row = existing.get((user_id, ingredient_id))
+                if row is None:
+                    if delta > 0:
+                        created.append((user_id, ingredient_id, delta))
+                    continue
+                row.amount += delta
+                if row.amount > 0:
+                    changed.append(row)
+                else:
+                    removed.append(row.pk)
+            self.insert_or_add(created)
+            self.bulk_update(changed, ('amount',))
+            self.filter(pk__in=removed).delete()
+
+    def insert_or_add(self, rows):
+        """Вставляет строки (user_id, ingredient_id, amount).
+
+        Если строку уже вставила параллельная транзакция, amount
+        прибавляется к ней.
+        """
+        if not rows:
+            return
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                'VALUES (%s, %s, %s) '
+                'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                'SET {amount} = {table}.{amount} + EXCLUDED.{amount}'.format(
+                    table=table,
+                    user=quote('user_id'),
+                    ingredient=quote('ingredient_id'),
+                    amount=quote('amount')
+                ),
+                rows
+            )
+
+    def add_recipes(self, user, recipe_ids, sign=1):
+        """Учитывает добавление (sign=1) или удаление (sign=-1) рецептов."""
+        self.apply({
+            (user.pk, ingredient_id): sign * total
+            for ingredient_id, total in RecipeIngredients.objects.filter(
+                recipe__in=recipe_ids
+            ).values_list('ingredient_id').annotate(
+                total=Sum('amount')
+            ).order_by()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Учитывает изменение продуктов рецепта у всех, кто его добавил.
+
+        old_amounts и new_amounts - словари {ingredient_id: amount}.
+        """
+        changes = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        self.apply({
+            (user_id, ingredient_id): delta
+            for user_id in recipe.shoppingcarts.values_list(
+                'user_id', flat=True
+            )
+            for ingredient_id, delta in changes.items()
+        })
+
+    def live_totals(self):
+        """Сводный список покупок, вычисленный по корзинам."""
+        return RecipeIngredients.objects.filter(
+            ~Q(recipe__shoppingcarts=None)
+        ).values_list(
+            'recipe__shoppingcarts__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=total
+                    )
+                    for user_id, ingredient_id, total in
+                    self.live_totals().iterator()
+                ),
+                batch_size=SHOPPING_CART_BATCH_SIZE
+            )
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сводное количество продукта в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Продукт'
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        default_related_name = 'shopping_cart_ingredients'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient'
+            )
+        ]
+        verbose_name = 'продукт списка покупок'
+        verbose_name_plural = 'продукты списков покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
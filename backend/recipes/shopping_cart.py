@@ -0,0 +1,84 @@
+"""Сводный список покупок (ShoppingCartIngredient) в сигналах моделей.
+
+Добавление и удаление строк ShoppingCart и RecipeIngredients через модель,
+а также удаление рецепта (в том числе из админки и каскадом) меняют
+сводную таблицу сигналами. Массовые вставки (bulk_create), bulk_update
+и пакетные удаления без сигналов вызывают методы
+ShoppingCartIngredient.objects явно.
+Расхождения исправляет команда rebuild_shopping_cart.
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+
+from .models import (
+    Recipe, RecipeIngredients, ShoppingCart, ShoppingCartIngredient, User
+)
+
+
+def deleted_with_recipe(origin):
+    """Удаление начато с рецепта или его автора.
+
+    Тогда сводная таблица уже исправлена в recipe_deleting, и каскадное
+    удаление корзин и продуктов рецепта учитывать не нужно.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, (Recipe, User))
+
+
+def recipe_deleting(sender, instance, **kwargs):
+    ShoppingCartIngredient.objects.change_recipe(
+        instance,
+        dict(instance.recipe_ingredients.values_list(
+            'ingredient_id', 'amount'
+        )),
+        {}
+    )
+
+
+def cart_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ShoppingCartIngredient.objects.add_recipes(
+            instance.user, [instance.recipe_id]
+        )
+
+
+def cart_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_with_recipe(origin):
+        ShoppingCartIngredient.objects.add_recipes(
+            instance.user, [instance.recipe_id], sign=-1
+        )
+
+
+def ingredient_saving(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние продукт и количество изменяемой строки."""
+    instance.previous_amounts = {} if raw or instance.pk is None else dict(
+        sender.objects.filter(pk=instance.pk).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def ingredient_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ShoppingCartIngredient.objects.change_recipe(
+            instance.recipe,
+            instance.previous_amounts,
+            {instance.ingredient_id: instance.amount}
+        )
+
+
+def ingredient_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_with_recipe(origin):
+        ShoppingCartIngredient.objects.change_recipe(
+            instance.recipe, {instance.ingredient_id: instance.amount}, {}
+        )
+
+
+pre_delete.connect(recipe_deleting, sender=Recipe)
+post_save.connect(cart_created, sender=ShoppingCart)
+post_delete.connect(cart_deleted, sender=ShoppingCart)
+pre_save.connect(ingredient_saving, sender=RecipeIngredients)
+post_save.connect(ingredient_saved, sender=RecipeIngredients)
+post_delete.connect(ingredient_deleted, sender=RecipeIngredients)
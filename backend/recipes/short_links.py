@@ -0,0 +1,136 @@
+"""Короткие ссылки на рецепты.
+
+Код ссылки - id рецепта в base62. Коды из одних цифр дополняются ведущим
+нулём base62 ('a'), поэтому ссылки вида /s/<id> из одних цифр остаются
+старыми ссылками по id. Существование рецепта проверяется по LRU-кэшу
+процесса, затем по общему кэшу Django, и только потом по БД; создание и
+удаление рецептов обновляют общий кэш сигналами.
+"""
+import string
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
+
+from .constants import (
+    SHORT_LINK_CACHE_TIMEOUT, SHORT_LINK_LOCAL_SIZE, SHORT_LINK_LOCAL_TIMEOUT,
+    SHORT_LINK_MAX_AGE, SHORT_LINK_MAX_ID, SHORT_LINK_MISSING_TIMEOUT
+)
+from .models import Recipe
+
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)
+DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+
+
+def encode(pk):
+    code = ''
+    while True:
+        pk, digit = divmod(pk, BASE)
+        code = ALPHABET[digit] + code
+        if not pk:
+            break
+    return ALPHABET[0] + code if code.isdigit() else code
+
+
+def decode(code):
+    """id рецепта по коду или старой ссылке из цифр, None для чужих кодов
+    и id больше допустимого в БД."""
+    if code.isdigit():
+        pk = int(code)
+    else:
+        pk = 0
+        for char in code:
+            if char not in DIGITS:
+                return None
+            pk = pk * BASE + DIGITS[char]
+    return pk if pk <= SHORT_LINK_MAX_ID else None
+
+
+class LocalCache:
+    """LRU-кэш процесса, записи которого устаревают через timeout секунд."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[1] < time.monotonic():
+                return None
+            self.items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+local_cache = LocalCache(SHORT_LINK_LOCAL_SIZE, SHORT_LINK_LOCAL_TIMEOUT)
+
+
+def cache_key(pk):
+    return f'short-link:{pk}'
+
+
+def remember(pk, exists):
+    cache.set(
+        cache_key(pk), exists,
+        SHORT_LINK_CACHE_TIMEOUT if exists else SHORT_LINK_MISSING_TIMEOUT
+    )
+    local_cache.set(pk, exists)
+
+
+def recipe_exists(pk):
+    exists = local_cache.get(pk)
+    if exists is not None:
+        return exists
+    exists = cache.get(cache_key(pk))
+    if exists is None:
+        exists = Recipe.objects.filter(pk=pk).exists()
+        remember(pk, exists)
+    else:
+        local_cache.set(pk, exists)
+    return exists
+
+
+def short_link_response(request, code):
+    """Перенаправление на страницу рецепта по коду короткой ссылки."""
+    pk = decode(code)
+    if pk is None or not recipe_exists(pk):
+        raise Http404(
+            'Рецепт, соответствующий короткой ссылке {}, не найден.'.format(
+                request.get_full_path()
+            )
+        )
+    response = redirect(request.build_absolute_uri(f'/recipes/{pk}/'))
+    patch_cache_control(response, public=True, max_age=SHORT_LINK_MAX_AGE)
+    return response
+
+
+def remember_created(sender, instance, created, **kwargs):
+    if created:
+        remember(instance.pk, True)
+
+
+def remember_deleted(sender, instance, **kwargs):
+    remember(instance.pk, False)
+
+
+post_save.connect(remember_created, sender=Recipe)
+post_delete.connect(remember_deleted, sender=Recipe)
@@ -0,0 +1,97 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from .models import Favorite, Follow, Recipe, ShoppingCart, User
+
+USERS_COUNT = 5
+RECIPES_PER_AUTHOR = 10
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Планы запросов проверяются только на PostgreSQL.'
+)
+class IndexUsageTest(TestCase):
+    """Фильтры рецептов, избранного и подписок используют индексы.
+
+    На маленьких таблицах планировщик выбрал бы полный просмотр, поэтому
+    полный просмотр и сортировка запрещены: остаётся индекс, который
+    сразу отдаёт строки в нужном порядке.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass'
+            )
+            for i in range(USERS_COUNT)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Текст',
+                image='recipes_images/recipe.png', cooking_time=10
+            )
+            for author in cls.users
+            for i in range(RECIPES_PER_AUTHOR)
+        ]
+        for user in cls.users:
+            Favorite.objects.bulk_create(
+                Favorite(user=user, recipe=recipe)
+                for recipe in recipes[::2]
+            )
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=user, recipe=recipe)
+                for recipe in recipes[1::2]
+            )
+            Follow.objects.bulk_create(
+                Follow(user=user, author=author)
+                for author in cls.users if author != user
+            )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE {}'.format(', '.join(
+                connection.ops.quote_name(model._meta.db_table)
+                for model in (Favorite, Follow, Recipe, ShoppingCart)
+            )))
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    def test_user_favorites(self):
+        self.assertUsesIndex(
+            Favorite.objects.filter(user=self.users[0]).order_by(
+                'recipe_id'
+            ).values_list('recipe_id', flat=True),
+            'favorite_user_recipe_idx'
+        )
+
+    def test_user_shopping_cart(self):
+        self.assertUsesIndex(
+            ShoppingCart.objects.filter(user=self.users[0]).order_by(
+                'recipe_id'
+            ).values_list('recipe_id', flat=True),
+            'shoppingcart_user_recipe_idx'
+        )
+
+    def test_author_recipes(self):
+        self.assertUsesIndex(
+            Recipe.objects.filter(author=self.users[0]).order_by(
+                '-pub_date'
+            ),
+            'recipe_author_pub_date_idx'
+        )
+
+    def test_author_followers(self):
+        self.assertUsesIndex(
+            Follow.objects.filter(author=self.users[0]).order_by(
+                'user_id'
+            ).values_list('user_id', flat=True),
+            'follow_author_user_idx'
+        )
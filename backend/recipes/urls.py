@@ -5,5 +5,5 @@ from .views import short_url_redirection
 app_name = 'recipes'
 
 urlpatterns = [
-    path('s/<int:pk>', short_url_redirection, name='short_url')
+    path('s/<str:code>', short_url_redirection, name='short_url')
 ]
@@ -0,0 +1,48 @@
+"""Версия рецепта (updated_at) при изменении его продуктов и тегов.
+
+ETag рецепта и ключ кэша его представления строятся из updated_at.
+RecipeSerializer сам сохраняет рецепт с новым updated_at, а сигналы
+обновляют его при изменении продуктов и тегов в обход сериалайзера:
+в админке и через ORM.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from .models import Recipe, RecipeIngredients
+from .shopping_cart import deleted_with_recipe
+
+
+def touch(recipe_ids):
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+
+
+def ingredient_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch([instance.recipe_id])
+
+
+def ingredient_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_with_recipe(origin):
+        touch([instance.recipe_id])
+
+
+def tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance.cleared_recipe_ids = list(
+            instance.recipes.values_list('pk', flat=True)
+        )
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            touch([instance.pk])
+        elif action == 'post_clear':
+            touch(instance.cleared_recipe_ids)
+        else:
+            touch(pk_set)
+
+
+post_save.connect(ingredient_saved, sender=RecipeIngredients)
+post_delete.connect(ingredient_deleted, sender=RecipeIngredients)
+m2m_changed.connect(tags_changed, sender=Recipe.tags.through)
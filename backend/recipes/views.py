@@ -1,17 +1,9 @@
-from django.http import Http404
-from django.shortcuts import redirect
+from .short_links import short_link_response
 
-from .models import Recipe
 
+def short_url_redirection(request, code):
+    """Функция для перенаправления по короткой ссылке.
 
-def short_url_redirection(request, pk):
-    """Функция для перенаправления по короткой ссылке."""
-    if not Recipe.objects.filter(pk=pk).exists():
-        raise Http404(
-            'Рецепт, соответствующий короткой ссылке {}, не найден.'.format(
-                request.get_full_path()
-            )
-        )
-    return redirect(request.build_absolute_uri(
-        f'/recipes/{pk}/'
-    ))
+    Обычно такие запросы обрабатывает ShortLinkMiddleware раньше.
+    """
+    return short_link_response(request, code)